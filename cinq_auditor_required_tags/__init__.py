@@ -1,10 +1,25 @@
+import hashlib
+import json
 import time
+from collections import defaultdict
 from contextlib import suppress
-from datetime import datetime
+from itertools import chain, islice
+from datetime import datetime, timedelta
 
 import pytimeparse
-from cinq_auditor_required_tags.exceptions import ResourceActionError
-from cinq_auditor_required_tags.providers import process_action
+from cinq_auditor_required_tags.actions import AuditAction, ContactCache, Notice
+from cinq_auditor_required_tags.apicalls import api_calls
+from cinq_auditor_required_tags.checkpoints import RunCheckpoint, get_schedule, prune_runs, save_schedule
+from cinq_auditor_required_tags.events import SQSEventQueue
+from cinq_auditor_required_tags.exceptions import ResourceActionError, ResourceNotReadyError
+from cinq_auditor_required_tags.forecast import forecast_enforcement, next_deadlines, parse_schedule_value
+from cinq_auditor_required_tags.journal import DEFAULT_JOURNAL_DIR, enforcement_journal
+from cinq_auditor_required_tags.policies import PolicyIndex
+from cinq_auditor_required_tags.providers import STATE_NOT_FOUND, get_live_states, process_action
+from cinq_auditor_required_tags.schema import IssueSnapshot, create_tables
+from cinq_auditor_required_tags.sharding import get_coordinator
+from cinq_auditor_required_tags.snapshots import delete_snapshot, prune_tombstones, save_snapshot, sync_snapshots
+from cinq_auditor_required_tags.validation import OwnerValidator
 
 from cloud_inquisitor import CINQ_PLUGINS
 from cloud_inquisitor.config import dbconfig, ConfigOption
@@ -12,13 +27,57 @@ from cloud_inquisitor.constants import NS_AUDITOR_REQUIRED_TAGS, NS_GOOGLE_ANALY
 from cloud_inquisitor.database import db
 from cloud_inquisitor.plugins import BaseAuditor
 from cloud_inquisitor.plugins.types.issues import RequiredTagsIssue
-from cloud_inquisitor.utils import validate_email, get_resource_id, send_notification, get_template, NotificationContact
+from cloud_inquisitor.schema import Account, Issue, Resource
+from cloud_inquisitor.utils import get_resource_id, send_notification, get_template, NotificationContact
+
+
+# The auditor is instantiated for every run, so the forecast data used by adaptive scheduling is cached for the
+# process. Keyed by the worker key and the generation of the run the schedule was saved by
+_forecast_cache = {'key': None, 'data': None}
+
+# Live resource states for which enforcing the action would be a no-op
+SKIP_LIVE_STATES = {
+    AuditActions.REMOVE: ('shutting-down', 'terminated', STATE_NOT_FOUND),
+    AuditActions.STOP: ('stopping', 'stopped', 'shutting-down', 'terminated', STATE_NOT_FOUND)
+}
+
+
+def add_notice(notices, notice, contacts):
+    """Add a notice to the notices of each of its contacts. The notice is shared between the contacts
+
+    Args:
+        notices (`dict`): Mapping of contacts to the `fixed` and `not_fixed` lists of :obj:`Notice`
+        notice (:obj:`Notice`): Notice to add
+        contacts (iterable of `(str, str)`): Type and value of the contacts to notify
+
+    Returns:
+        `None`
+    """
+    key = 'fixed' if notice.action == AuditActions.FIXED else 'not_fixed'
+    for owner_type, owner_value in contacts:
+        contact = NotificationContact(type=owner_type, value=owner_value)
+        notices.setdefault(contact, {'fixed': [], 'not_fixed': []})[key].append(notice)
+
+
+def get_content_key(issue):
+    """Returns a hashable key of the parts of an issue which are updated by the audit
+
+    Args:
+        issue (`dict`): Dictionary with the `missing_tags` and `notes` of the issue
+
+    Returns:
+        `tuple`
+    """
+    return tuple(issue.get('missing_tags') or ()), tuple(issue.get('notes') or ())
 
 
 class RequiredTagsAuditor(BaseAuditor):
     name = 'Required Tags Compliance'
     ns = NS_AUDITOR_REQUIRED_TAGS
-    interval = dbconfig.get('interval', ns, 30)
+    # With adaptive scheduling the auditor is woken up every `min_interval` minutes, and decides itself whether any
+    # work is due
+    interval = dbconfig.get('min_interval', ns, 1) if dbconfig.get('adaptive_schedule', ns, False) \
+        else dbconfig.get('interval', ns, 30)
     tracking_enabled = dbconfig.get('enabled', NS_GOOGLE_ANALYTICS, False)
     tracking_id = dbconfig.get('tracking_id', NS_GOOGLE_ANALYTICS)
     confirm_shutdown = dbconfig.get('confirm_shutdown', ns, True)
@@ -26,6 +85,10 @@ class RequiredTagsAuditor(BaseAuditor):
     collect_only = None
     start_delay = 0
     options = (
+        ConfigOption('adaptive_schedule', False, 'bool',
+                     'Schedule runs based on upcoming alert and enforcement deadlines instead of a fixed interval'),
+        ConfigOption('action_batch_size', 100, 'int',
+                     'Number of actions to fetch the live resource state for at once, before enforcement'),
         ConfigOption(
             'alert_settings', {
                 '*': {
@@ -48,16 +111,46 @@ class RequiredTagsAuditor(BaseAuditor):
         ),
         ConfigOption('audit_ignore_tag', 'cinq_ignore', 'string', 'Do not audit resources have this tag set'),
         ConfigOption('always_send_email', True, 'bool', 'Send emails even in collect mode'),
+        ConfigOption('checkpoint_max_age', 60, 'int',
+                     'Resume interrupted runs from their last checkpoint if it is newer than this, in minutes'),
         ConfigOption('collect_only', True, 'bool', 'Do not shutdown instances, only update caches'),
         ConfigOption('confirm_shutdown', True, 'bool', 'Require manual confirmation before shutting down instances'),
         ConfigOption('email_subject', 'Required tags audit notification', 'string',
                      'Subject of the email notification'),
         ConfigOption('enabled', False, 'bool', 'Enable the Required Tags auditor'),
+        ConfigOption('event_queue_url', '', 'string',
+                     'URL of the SQS queue to read resource change events from. Leave empty to disable'),
+        ConfigOption('event_queue_region', 'us-west-2', 'string', 'Region of the resource change event queue'),
+        ConfigOption('event_queue_dlq_url', '', 'string',
+                     'URL of the SQS queue to move invalid resource change events to. Leave empty to drop them'),
+        ConfigOption('event_max_age', 24, 'int',
+                     'How long events of resources which can not be audited yet are kept, in hours'),
+        ConfigOption('event_retry_delay', 300, 'int',
+                     'How long to wait before retrying events of resources which have not been collected, in seconds'),
+        ConfigOption('export_overlap', 900, 'int',
+                     'How far delta exports go back before the requested time, to include late commits, in seconds'),
         ConfigOption('grace_period', 4, 'int', 'Only audit resources X minutes after being created'),
         ConfigOption('interval', 30, 'int', 'How often the auditor executes, in minutes.'),
+        ConfigOption('journal_dir', DEFAULT_JOURNAL_DIR, 'string',
+                     'Directory of the per process enforcement journal files, must persist across reboots'),
+        ConfigOption('journal_max_age', 30, 'int',
+                     'Maximum time enforcement records are buffered before being written, in seconds'),
+        ConfigOption('journal_max_records', 500, 'int', 'Number of enforcement records to buffer before writing'),
+        ConfigOption('owner_cache_size', 10000, 'int', 'Number of Owner tag validation results to cache'),
+        ConfigOption('owner_domains', [], 'array',
+                     'Only accept Owner tags with an email address in one of these domains. Leave empty to accept all'),
         ConfigOption('partial_owner_match', True, 'bool', 'Allow partial matches of the Owner tag'),
         ConfigOption('permanent_recipient', [], 'array', 'List of email addresses to receive all alerts'),
         ConfigOption('required_tags', ['owner', 'accounting', 'name'], 'array', 'List of required tags'),
+        ConfigOption('shard_count', 0, 'int',
+                     'Number of shards to split the issues into between auditor workers. Set to 0 to disable'),
+        ConfigOption('shard_lease_ttl', 900, 'int', 'How long a worker holds a shard without renewing it, in seconds'),
+        ConfigOption('tag_policies', [], 'json',
+                     'Required tag policies per resource type, account and region. Leave empty to use required_tags'),
+        ConfigOption('tombstone_max_age', 30, 'int',
+                     'How long fixed issues are kept for delta exports, in days'),
+        ConfigOption('max_interval', 60, 'int', 'Maximum time between full runs with adaptive scheduling, in minutes'),
+        ConfigOption('min_interval', 1, 'int', 'Minimum time between runs with adaptive scheduling, in minutes'),
         ConfigOption('lifecycle_expiration_days', 3, 'int',
                      'How many days we should set in the bucket policy for non-empty S3 buckets removal')
     )
@@ -67,14 +160,21 @@ class RequiredTagsAuditor(BaseAuditor):
         self.log.debug('Starting RequiredTags auditor')
 
         self.required_tags = dbconfig.get('required_tags', self.ns, ['owner', 'accounting', 'name'])
+        self.tag_policies = dbconfig.get('tag_policies', self.ns, [])
+        self.policy_index = PolicyIndex.from_config(self.tag_policies, self.required_tags)
         self.collect_only = dbconfig.get('collect_only', self.ns, True)
         self.always_send_email = dbconfig.get('always_send_email', self.ns, False)
-        self.permanent_emails = [
-            {'type': 'email', 'value': contact} for contact in dbconfig.get('permanent_recipient', self.ns, [])
-        ]
+        self.permanent_emails = tuple(
+            ('email', contact) for contact in dbconfig.get('permanent_recipient', self.ns, [])
+        )
+        self.contact_cache = ContactCache()
         self.email_subject = dbconfig.get('email_subject', self.ns, 'Required tags audit notification')
         self.grace_period = dbconfig.get('grace_period', self.ns, 4)
         self.partial_owner_match = dbconfig.get('partial_owner_match', self.ns, True)
+        self.owner_validator = OwnerValidator(
+            dbconfig.get('owner_cache_size', self.ns, 10000),
+            dbconfig.get('owner_domains', self.ns, [])
+        )
         self.audit_ignore_tag = dbconfig.get('audit_ignore_tag', NS_AUDITOR_REQUIRED_TAGS)
         self.alert_schedule = dbconfig.get('alert_settings', NS_AUDITOR_REQUIRED_TAGS)
         self.audited_types = dbconfig.get('audit_scope', NS_AUDITOR_REQUIRED_TAGS)['enabled']
@@ -83,45 +183,587 @@ class RequiredTagsAuditor(BaseAuditor):
             resource_type.resource_type_id: resource_type.resource_type
             for resource_type in db.ResourceType.find()
         }
+        self.resource_classes = self.get_resource_classes()
+        self.coordinator = None
+        self.listening = False
+        self.event_max_age = dbconfig.get('event_max_age', self.ns, 24) * 3600
+        self.event_retry_delay = dbconfig.get('event_retry_delay', self.ns, 300)
+        self.action_batch_size = dbconfig.get('action_batch_size', self.ns, 100)
+        self.adaptive_schedule = dbconfig.get('adaptive_schedule', self.ns, False)
+        self.min_interval = dbconfig.get('min_interval', self.ns, 1) * 60
+        self.max_interval = dbconfig.get('max_interval', self.ns, 60) * 60
+        self.schedule_generation = None
+        self.next_full_run = None
+        self.next_deadline = None
+        self.last_change_count = 0
+        self.checkpoint = None
+        self.checkpoint_max_age = dbconfig.get('checkpoint_max_age', self.ns, 60) * 60
+        self.tombstone_max_age = dbconfig.get('tombstone_max_age', self.ns, 30) * 86400
+        self.config_version = hashlib.sha1(json.dumps({
+            'alert_settings': self.alert_schedule,
+            'audit_scope': self.audited_types,
+            'audit_ignore_tag': self.audit_ignore_tag,
+            'collect_only': self.collect_only,
+            'partial_owner_match': self.partial_owner_match,
+            'required_tags': self.required_tags,
+            'tag_policies': self.tag_policies
+        }, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        enforcement_journal.configure(
+            dbconfig.get('journal_dir', self.ns, DEFAULT_JOURNAL_DIR) or None,
+            dbconfig.get('journal_max_records', self.ns, 500),
+            dbconfig.get('journal_max_age', self.ns, 30)
+        )
+        create_tables()
+
+        shard_count = dbconfig.get('shard_count', self.ns, 0)
+        if shard_count:
+            # The auditor is instantiated for every run, the coordinator and its leases are shared by the process
+            self.coordinator = get_coordinator(shard_count, dbconfig.get('shard_lease_ttl', self.ns, 900))
 
     def run(self, *args, **kwargs):
-        known_issues, new_issues, fixed_issues = self.get_resources()
-        known_issues += self.create_new_issues(new_issues)
-        actions = [
-            *[
-                {
-                    'action': AuditActions.FIXED,
-                    'action_description': None,
-                    'last_alert': issue.last_alert,
-                    'issue': issue,
-                    'resource': issue.resource,
-                    'owners': self.get_contacts(issue),
-                    'notes': issue.notes,
-                    'missing_tags': issue.missing_tags
-                } for issue in fixed_issues
-            ],
-            *self.get_actions(known_issues)
-        ]
-        notifications = self.process_actions(actions)
-        self.notify(notifications)
+        if not self.coordinator:
+            self.audit()
+            return
 
-    def get_known_resources_missing_tags(self):
-        non_compliant_resources = {}
-        audited_types = dbconfig.get('audit_scope', NS_AUDITOR_REQUIRED_TAGS, {'enabled': []})['enabled']
-        resource_types = {resource.resource_type: resource for resource in map(
+        if not self.coordinator.claim():
+            self.log.info('No shards available for worker {}, skipping run'.format(self.coordinator.worker_id))
+            return
+
+        # Renew the leases while the run is in progress, the next run adopts them if they have not expired
+        self.coordinator.start()
+        try:
+            self.audit()
+        finally:
+            self.coordinator.stop()
+
+    def audit(self):
+        """Audit the resources of the issues in the shards held by this worker, or of all issues without sharding
+
+        Returns:
+            `None`
+        """
+        if self.adaptive_schedule:
+            # Saved in the database, as the scheduler creates a new auditor for every run
+            self.schedule_generation, self.next_full_run, self.next_deadline = get_schedule(
+                self.get_worker_key(),
+                self.config_version
+            )
+            now = time.time()
+            if self.next_full_run and now < self.next_full_run:
+                if self.next_deadline is not None and now >= self.next_deadline:
+                    self.run_due()
+                return
+
+        enforcement_journal.replay()
+        sync_snapshots(in_shard=self.in_shard)
+        prune_tombstones(self.tombstone_max_age)
+        # Delta exports by generation are limited to the same period as the tombstones
+        prune_runs(self.tombstone_max_age)
+        self.checkpoint = RunCheckpoint.start(self.get_worker_key(), self.config_version, self.checkpoint_max_age)
+        try:
+            if self.checkpoint.scan is None:
+                known_ids, new_issues, fixed_ids = self.get_resources()
+                self.checkpoint.save_scan({
+                    'known': known_ids,
+                    'fixed': fixed_ids,
+                    'new': {
+                        issue_id: {
+                            'resource_type': self.resource_types[new_issue['resource'].resource_type_id],
+                            'resource_id': new_issue['resource_id'],
+                            'missing_tags': new_issue['missing_tags'],
+                            'notes': new_issue['notes']
+                        } for issue_id, new_issue in new_issues.items()
+                    }
+                })
+                pending_actions = []
+                notices = {}
+            else:
+                known_ids, new_issues, fixed_ids, pending_actions, notices = self.resume_run()
+
+            if self.coordinator:
+                self.coordinator.heartbeat()
+
+            # Issues are loaded in batches and actions generated lazily, consumed one batch at a time by process_actions
+            actions = chain(
+                pending_actions,
+                (self.get_fixed_action(issue) for issue in self.iter_issues(fixed_ids)),
+                self.get_actions(chain(self.iter_issues(known_ids), self.create_new_issues(new_issues)))
+            )
+            notifications = self.process_actions(actions, notices)
+
+            # The run is only finished once notified, an interrupted run resends the notices of its completed actions
+            self.notify(notifications)
+            self.checkpoint.finish()
+            generation = self.checkpoint.generation
+        finally:
+            self.checkpoint = None
+
+        self.contact_cache.clear()
+        self.log.debug('Owner validation cache: {hits} hits, {misses} misses, {size}/{max_size} entries'.format(
+            **self.owner_validator.stats
+        ))
+        for action, stats in sorted(api_calls.report().items()):
+            self.log.debug('AWS API calls for {}: {} calls, {} invocations, {} resources'.format(
+                action,
+                stats['calls'],
+                stats['invocations'],
+                stats['resources']
+            ))
+        api_calls.reset()
+
+        if self.adaptive_schedule:
+            self.schedule_next_run(generation)
+
+    def resume_run(self):
+        """Rebuild the state of an interrupted run from its checkpoint
+
+        Actions which were decided on but not completed are returned as pending actions, issues for which no action
+        has been decided yet are processed as usual. The notices of completed actions are restored, so they are sent
+        at the end of the run
+
+        Returns:
+            `(list, dict, list, list, dict)` - Known issue IDs, new issues, fixed issue IDs, pending actions and the
+            notices of the completed actions
+        """
+        scan = self.checkpoint.scan
+        recorded = self.checkpoint.get_actions()
+        pending = {issue_id: record for issue_id, record in recorded.items() if not record.completed}
+        notices = {}
+        for record in recorded.values():
+            if record.completed and record.notice:
+                add_notice(notices, Notice.from_json(record.notice['notice']), record.notice['contacts'])
+
+        issues = self.load_issues(pending)
+
+        # New issues may already have been created before the run was interrupted
+        new_ids = set(scan['new']) - set(recorded)
+        created_ids = self.get_existing_issue_ids(new_ids)
+        known_ids = [issue_id for issue_id in scan['known'] + sorted(created_ids) if issue_id not in recorded]
+        fixed_ids = [issue_id for issue_id in scan['fixed'] if issue_id not in recorded]
+        new_issues = {}
+        for issue_id in new_ids - created_ids:
+            new_issue = scan['new'][issue_id]
+            resource_class = self.resource_classes.get(new_issue['resource_type'])
+            resource = resource_class.get(new_issue['resource_id']) if resource_class else None
+            if resource:
+                new_issues[issue_id] = dict(new_issue, issue_id=issue_id, resource=resource)
+
+        audit_actions = {
+            str(action): action
+            for action in (AuditActions.ALERT, AuditActions.STOP, AuditActions.REMOVE, AuditActions.FIXED)
+        }
+        pending_actions = []
+        for issue_id, record in pending.items():
+            issue = issues.get(issue_id)
+            if not issue:
+                continue
+
+            action = audit_actions[record.action]
+            if action == AuditActions.FIXED:
+                pending_actions.append(self.get_fixed_action(issue))
+                continue
+
+            issue_alert_schedule = self.get_alert_schedule(self.resource_types[issue.resource.resource_type_id])
+            pending_actions.append(AuditAction(
+                action,
+                issue,
+                issue.resource,
+                owners=self.contact_cache.get(self.get_contacts(issue)),
+                action_description=record.action_description,
+                last_alert=parse_schedule_value(record.last_alert)
+                if action in (AuditActions.STOP, AuditActions.REMOVE) else record.last_alert,
+                stop_after=issue_alert_schedule['stop'],
+                remove_after=issue_alert_schedule['remove'],
+                notes=issue.notes,
+                missing_tags=issue.missing_tags
+            ))
+
+        self.log.info('Resuming run {} with {} pending actions and {} remaining issues'.format(
+            self.checkpoint.generation,
+            len(pending_actions),
+            len(known_ids) + len(fixed_ids) + len(new_issues)
+        ))
+        return known_ids, new_issues, fixed_ids, pending_actions, notices
+
+    def get_worker_key(self):
+        """Returns a key identifying the set of issues handled by this worker
+
+        Returns:
+            `str`
+        """
+        if not self.coordinator:
+            return 'all'
+
+        return 'shards:{}'.format(','.join(str(shard) for shard in sorted(self.coordinator.shards)))
+
+    def get_alert_schedule(self, resource_type):
+        """Returns the alert schedule for a resource type
+
+        Args:
+            resource_type (`str`): Name of the resource type
+
+        Returns:
+            `dict`
+        """
+        return self.alert_schedule[resource_type] if \
+            resource_type in self.alert_schedule \
+            else self.alert_schedule['*']
+
+    def run_due(self):
+        """Partial run, auditing only the resources of issues with an alert or enforcement deadline that has passed
+
+        Returns:
+            `None`
+        """
+        forecast_data = self.get_cached_forecast_data()
+        deadlines = next_deadlines(forecast_data, self.alert_schedule)
+        now = time.time()
+
+        actions = []
+        due_ids = []
+        for idx in (deadlines <= now).nonzero()[0]:
+            resource_type = forecast_data['resource_type'][idx]
+            resource_id = forecast_data['resource_id'][idx]
+            due_ids.append(forecast_data['issue_id'][idx])
+            try:
+                actions += self.audit_resource(resource_type, resource_id)
+            except ResourceNotReadyError:
+                # The issue and its resource were removed since the forecast data was loaded
+                continue
+            except Exception:
+                self.log.exception('Failed auditing resource {}/{}'.format(resource_type, resource_id))
+
+        self.notify(self.process_actions(actions))
+        self.contact_cache.clear()
+        self.refresh_forecast_data(due_ids)
+        self.next_deadline = self.get_next_deadline()
+        save_schedule(self.schedule_generation, self.next_full_run, self.next_deadline)
+
+    def get_cached_forecast_data(self):
+        """Returns the forecast data for the issues in the shards of this worker, loading it if it is not cached, the
+        shards have changed or a full run has finished since it was loaded
+
+        Returns:
+            `dict` of `list`
+        """
+        key = (self.get_worker_key(), self.schedule_generation)
+        if _forecast_cache['data'] is None or _forecast_cache['key'] != key:
+            _forecast_cache['data'] = self.get_forecast_data(shard_only=True)
+            _forecast_cache['key'] = key
+
+        return _forecast_cache['data']
+
+    def refresh_forecast_data(self, issue_ids):
+        """Update the cached forecast data for a set of issues after they have been audited, removing the issues
+        which no longer exist
+
+        Args:
+            issue_ids (`list` of `str`): IDs of the audited issues
+
+        Returns:
+            `None`
+        """
+        if not issue_ids:
+            return
+
+        try:
+            issues = {
+                issue_id: (created, last_alert)
+                for issue_id, created, last_alert in db.session.query(
+                    IssueSnapshot.issue_id, IssueSnapshot.created, IssueSnapshot.last_alert
+                ).filter(IssueSnapshot.issue_id.in_(issue_ids))
+            }
+        finally:
+            db.session.rollback()
+
+        forecast_data = self.get_cached_forecast_data()
+        index = {issue_id: idx for idx, issue_id in enumerate(forecast_data['issue_id'])}
+        removed = []
+        for issue_id in issue_ids:
+            idx = index.get(issue_id)
+            if idx is None:
+                continue
+
+            if issue_id in issues:
+                forecast_data['created'][idx], forecast_data['last_alert'][idx] = issues[issue_id]
+            else:
+                removed.append(idx)
+
+        for idx in sorted(removed, reverse=True):
+            for column in forecast_data.values():
+                del column[idx]
+
+    def schedule_next_run(self, generation):
+        """Determine when the next full and partial runs should happen, and save the schedule on the finished run
+
+        Full runs happen every `max_interval` minutes, sooner if the last run changed a large share of the issues.
+        Partial runs happen as soon as the next alert or enforcement deadline has passed, but never more often than
+        `min_interval`. The forecast data used to find the deadlines is loaded once here, and only updated for the
+        issues audited by the partial runs
+
+        Args:
+            generation (`int`): Generation of the finished full run
+
+        Returns:
+            `None`
+        """
+        self.schedule_generation = generation
+        issue_count = len(self.get_cached_forecast_data()['issue_id'])
+        change_ratio = min(1.0, self.last_change_count / max(issue_count, 1))
+        interval = self.max_interval - (self.max_interval - self.min_interval) * change_ratio
+        self.next_full_run = time.time() + interval
+        self.next_deadline = self.get_next_deadline()
+        save_schedule(generation, self.next_full_run, self.next_deadline)
+
+        self.log.debug('Next full run in {:.0f} seconds, next deadline at {}'.format(interval, self.next_deadline))
+
+    def get_next_deadline(self):
+        """Returns the earliest upcoming alert or enforcement deadline, or `None` if there is nothing to do
+
+        Returns:
+            `float` or `None`
+        """
+        if self.collect_only:
+            return None
+
+        deadlines = next_deadlines(self.get_cached_forecast_data(), self.alert_schedule)
+        if not len(deadlines) or deadlines.min() == float('inf'):
+            return None
+
+        return max(float(deadlines.min()), time.time() + self.min_interval)
+
+    def listen(self, event_queue=None, wait_time=20, max_backoff=300):
+        """Continuously audit resources as change events arrive on the event queue
+
+        The periodic `run` remains responsible for reconciling any events that were missed. Errors, such as the queue
+        being unavailable, are logged and retried with an exponential backoff
+
+        Args:
+            event_queue (:obj:`BaseEventQueue`): Queue to read events from, defaults to the configured SQS queue
+            wait_time (`int`): Number of seconds to wait for new events on each poll
+            max_backoff (`int`): Maximum number of seconds to wait before retrying after an error
+
+        Returns:
+            `None`
+        """
+        event_queue = event_queue or self.get_event_queue()
+        if not event_queue:
+            self.log.warning('No event queue configured, not listening for resource change events')
+            return
+
+        # The listener does not claim shards nor register as a worker, so it does not reduce the share of the workers
+        self.listening = True
+        failures = 0
+        while True:
+            try:
+                self.process_events(event_queue, wait_time=wait_time)
+                failures = 0
+            except Exception:
+                failures += 1
+                backoff = min(2 ** failures, max_backoff)
+                self.log.exception('Failed processing resource change events, retrying in {} seconds'.format(backoff))
+                time.sleep(backoff)
+
+    def get_event_queue(self):
+        """Returns the configured resource change event queue, or `None` if event driven audits are disabled
+
+        Returns:
+            :obj:`SQSEventQueue` or `None`
+        """
+        queue_url = dbconfig.get('event_queue_url', self.ns, '')
+        if not queue_url:
+            return None
+
+        return SQSEventQueue(
+            queue_url,
+            dbconfig.get('event_queue_region', self.ns, 'us-west-2'),
+            dbconfig.get('event_queue_dlq_url', self.ns, '') or None
+        )
+
+    def process_events(self, event_queue, max_events=10, wait_time=0):
+        """Audit the resources referenced by a batch of pending change events
+
+        Args:
+            event_queue (:obj:`BaseEventQueue`): Queue to read events from
+            max_events (`int`): Maximum number of events to process
+            wait_time (`int`): Number of seconds to wait for events if none are pending
+
+        Returns:
+            `int` - Number of events processed
+        """
+        events = event_queue.receive(max_events, wait_time)
+        if not events:
+            return 0
+
+        actions = []
+        failed = set()
+        delayed = {}
+        # Multiple events for the same resource only require a single audit
+        for resource_type, resource_id in {(event.resource_type, event.resource_id) for event in events}:
+            try:
+                actions += self.audit_resource(resource_type, resource_id)
+            except ResourceNotReadyError as error:
+                delayed[(resource_type, resource_id)] = error.delay
+                self.log.debug('Delaying audit of resource {}/{} by {} seconds: {}'.format(
+                    resource_type,
+                    resource_id,
+                    error.delay,
+                    error
+                ))
+            except Exception:
+                failed.add((resource_type, resource_id))
+                self.log.exception('Failed auditing resource {}/{}'.format(resource_type, resource_id))
+
+        notices = self.process_actions(actions)
+
+        # Events for resources which failed to audit are left on the queue, to be delivered again. Events for resources
+        # which can not be audited yet are delivered again once they can, unless they are too old
+        now = time.time()
+        for event in events:
+            key = (event.resource_type, event.resource_id)
+            if key in failed:
+                continue
+
+            if key in delayed:
+                if not event.sent or now - event.sent < self.event_max_age:
+                    event_queue.retry(event, delayed[key])
+                    continue
+
+                self.log.info('Dropping event for resource {}/{} after {} hours, leaving it to the periodic run'.format(
+                    event.resource_type,
+                    event.resource_id,
+                    self.event_max_age // 3600
+                ))
+
+            event_queue.ack(event)
+
+        self.notify(notices)
+        return len(events)
+
+    def audit_resource(self, resource_type, resource_id):
+        """Check a single resource for compliance and create, update or fix its issue
+
+        Args:
+            resource_type (`str`): Type of the resource
+            resource_id (`str`): ID of the resource
+
+        Returns:
+            `list` of actions to process for the resource
+
+        Raises:
+            :obj:`ResourceNotReadyError` if the resource has not been collected yet, or is still in its grace period
+        """
+        if resource_type not in self.audited_types:
+            return []
+
+        issue_id = get_resource_id('reqtag', resource_id)
+        if not self.in_shard(issue_id):
+            return []
+
+        try:
+            issue = RequiredTagsIssue.get(issue_id)
+            resource_class = self.resource_classes.get(resource_type)
+            resource = resource_class.get(resource_id) if resource_class else None
+            if not resource and not issue:
+                # Either not collected yet, or removed before it was ever audited
+                raise ResourceNotReadyError('Resource has not been collected', self.event_retry_delay)
+
+            missing_tags, notes = self.check_required_tags_compliance(resource) if resource else ([], [])
+
+            if not missing_tags:
+                return [self.get_fixed_action(issue)] if issue else []
+
+            if issue:
+                issue.update({'missing_tags': missing_tags, 'notes': notes})
+                db.session.add(issue.issue)
+                save_snapshot(issue)
+                actions = list(self.get_actions([issue]))
+                db.session.commit()
+                return actions
+
+            age = (datetime.utcnow() - resource.resource_creation_date).total_seconds()
+            if age // 3600 < self.grace_period:
+                raise ResourceNotReadyError(
+                    'Resource is in its grace period',
+                    max(self.grace_period * 3600 - age, self.event_retry_delay)
+                )
+
+            actions = list(self.get_actions(self.create_new_issues({
+                issue_id: {
+                    'issue_id': issue_id,
+                    'missing_tags': missing_tags,
+                    'notes': notes,
+                    'resource_id': resource_id,
+                    'resource': resource
+                }
+            })))
+            db.session.commit()
+            return actions
+        finally:
+            db.session.rollback()
+
+    def get_fixed_action(self, issue):
+        """Returns the action for an issue which has been fixed
+
+        Args:
+            issue (:obj:`RequiredTagsIssue`): Issue record
+
+        Returns:
+            :obj:`AuditAction`
+        """
+        return AuditAction(
+            AuditActions.FIXED,
+            issue,
+            issue.resource,
+            owners=self.contact_cache.get(self.get_contacts(issue)),
+            last_alert=issue.last_alert,
+            notes=issue.notes,
+            missing_tags=issue.missing_tags
+        )
+
+    def in_shard(self, issue_id):
+        """Returns `True` if the issue belongs to one of the shards handled by this worker
+
+        The event listener does not hold any shards, it audits the resources of every event and leaves the enforcement
+        to the worker holding the shard
+
+        Args:
+            issue_id (`str`): ID of the issue
+
+        Returns:
+            `bool`
+        """
+        return not self.coordinator or self.listening or self.coordinator.owns(issue_id)
+
+    @staticmethod
+    def get_resource_classes():
+        """Returns a mapping of resource type names to the resource classes
+
+        Returns:
+            `dict`
+        """
+        return {resource.resource_type: resource for resource in map(
             lambda plugin: plugin.load(),
             CINQ_PLUGINS['cloud_inquisitor.plugins.types']['plugins']
         )}
 
+    def get_known_resources_missing_tags(self):
+        non_compliant_resources = {}
+        audited_types = dbconfig.get('audit_scope', NS_AUDITOR_REQUIRED_TAGS, {'enabled': []})['enabled']
+        resource_types = self.get_resource_classes()
+
         try:
             # resource_info is a tuple with the resource typename as [0] and the resource class as [1]
             resources = filter(lambda resource_info: resource_info[0] in audited_types, resource_types.items())
             for resource_name, resource_class in resources:
                 for resource_id, resource in resource_class.get_all().items():
+                    # Not really a get, it generates a new resource ID
+                    issue_id = get_resource_id('reqtag', resource_id)
+                    if not self.in_shard(issue_id):
+                        continue
+
                     missing_tags, notes = self.check_required_tags_compliance(resource)
                     if missing_tags:
-                        # Not really a get, it generates a new resource ID
-                        issue_id = get_resource_id('reqtag', resource_id)
                         non_compliant_resources[issue_id] = {
                             'issue_id': issue_id,
                             'missing_tags': missing_tags,
@@ -135,36 +777,166 @@ class RequiredTagsAuditor(BaseAuditor):
 
     def get_resources(self):
         found_issues = self.get_known_resources_missing_tags()
-        existing_issues = RequiredTagsIssue.get_all().items()
-        known_issues = []
-        fixed_issues = []
+        existing_issues = {
+            issue_id: properties for issue_id, properties in self.get_issue_properties(
+                ('missing_tags', 'notes', 'created', 'last_alert')
+            ).items() if self.in_shard(issue_id)
+        }
 
-        for existing_issue_id, existing_issue in existing_issues:
-            # Check if the existing issue is still persists
-            resource = found_issues.pop(existing_issue_id, None)
-            if resource:
-                if resource['missing_tags'] != existing_issue.missing_tags:
-                    existing_issue.set_property('missing_tags', resource['missing_tags'])
-                if resource['notes'] != existing_issue.notes:
-                    existing_issue.set_property('notes', resource['notes'])
-                db.session.add(existing_issue.issue)
-                known_issues.append(existing_issue)
-            else:
-                fixed_issues.append(existing_issue)
+        found_ids = set(found_issues)
+        existing_ids = set(existing_issues)
+        fixed_ids = existing_ids - found_ids
+        changed_ids = {
+            issue_id for issue_id in existing_ids & found_ids
+            if get_content_key(found_issues[issue_id]) != get_content_key(existing_issues[issue_id])
+        }
+        # Unchanged issues are only loaded if they have an alert or enforcement action due
+        now = time.time()
+        due_ids = {
+            issue_id for issue_id in existing_ids & found_ids - changed_ids
+            if self.is_action_due(found_issues[issue_id]['resource'], existing_issues[issue_id], now)
+        }
+        try:
+            for issue in self.iter_issues(changed_ids):
+                issue_id = issue.id
+                issue.update({
+                    'missing_tags': found_issues[issue_id]['missing_tags'],
+                    'notes': found_issues[issue_id]['notes']
+                })
+                db.session.add(issue.issue)
+                save_snapshot(issue)
+            db.session.commit()
+        finally:
+            db.session.rollback()
 
+        grace_cutoff = datetime.utcnow() - timedelta(hours=self.grace_period)
         new_issues = {
-            resource_id: resource for resource_id, resource in found_issues.items()
-            if
-            ((datetime.utcnow() - resource[
-                'resource'].resource_creation_date).total_seconds() // 3600) >= self.grace_period
+            issue_id: found_issues[issue_id] for issue_id in found_ids - existing_ids
+            if found_issues[issue_id]['resource'].resource_creation_date <= grace_cutoff
         }
-        db.session.commit()
-        return known_issues, new_issues, fixed_issues
+        self.last_change_count = len(fixed_ids) + len(changed_ids) + len(new_issues)
+        return sorted(changed_ids | due_ids), new_issues, sorted(fixed_ids)
 
-    def create_new_issues(self, new_issues):
+    @staticmethod
+    def get_issue_properties(names):
+        """Load a set of properties for all required tags issues from the issue snapshots, without creating the
+        issue objects
+
+        Args:
+            names (`tuple` of `str`): Names of the properties to load
+
+        Returns:
+            `dict` mapping issue IDs to a `dict` of property names and values
+        """
         try:
-            for non_compliant_resource in new_issues.values():
+            columns = [getattr(IssueSnapshot, name) for name in names]
+            return {
+                row[0]: dict(zip(names, row[1:]))
+                for row in db.session.query(IssueSnapshot.issue_id, *columns)
+            }
+        finally:
+            db.session.rollback()
+
+    @staticmethod
+    def load_issues(issue_ids, batch_size=500):
+        """Load the issue objects for a set of issue IDs, in batches
+
+        Args:
+            issue_ids (`set` of `str`): IDs of the issues to load
+            batch_size (`int`): Number of issues to load per query
+
+        Returns:
+            `dict` mapping issue IDs to :obj:`RequiredTagsIssue` objects
+        """
+        issues = {}
+        issue_ids = list(issue_ids)
+        for idx in range(0, len(issue_ids), batch_size):
+            for issue in db.session.query(Issue).filter(Issue.issue_id.in_(issue_ids[idx:idx + batch_size])):
+                issues[issue.issue_id] = RequiredTagsIssue(issue)
+
+        return issues
 
+    @staticmethod
+    def iter_issues(issue_ids, batch_size=500):
+        """Generate the issue objects for a list of issue IDs, loading one batch at a time. Issues which no longer
+        exist are skipped
+
+        Args:
+            issue_ids (iterable of `str`): IDs of the issues to load
+            batch_size (`int`): Number of issues to load per query
+
+        Returns:
+            generator of :obj:`RequiredTagsIssue`
+        """
+        issue_ids = list(issue_ids)
+        for idx in range(0, len(issue_ids), batch_size):
+            for issue in db.session.query(Issue).filter(Issue.issue_id.in_(issue_ids[idx:idx + batch_size])).all():
+                yield RequiredTagsIssue(issue)
+
+    @staticmethod
+    def get_existing_issue_ids(issue_ids, batch_size=500):
+        """Returns the subset of a set of issue IDs for which an issue exists
+
+        Args:
+            issue_ids (iterable of `str`): IDs of the issues to check
+            batch_size (`int`): Number of issues to check per query
+
+        Returns:
+            `set` of `str`
+        """
+        issue_ids = list(issue_ids)
+        existing = set()
+        for idx in range(0, len(issue_ids), batch_size):
+            existing.update(
+                issue_id for issue_id, in db.session.query(Issue.issue_id).filter(
+                    Issue.issue_id.in_(issue_ids[idx:idx + batch_size])
+                )
+            )
+
+        return existing
+
+    def is_action_due(self, resource, issue_properties, now):
+        """Returns `True` if `determine_action` could return anything but `IGNORE` for the issue
+
+        Args:
+            resource (:obj:`Resource`): Resource the issue was raised for
+            issue_properties (`dict`): The `created` and `last_alert` properties of the issue
+            now (`float`): Current time
+
+        Returns:
+            `bool`
+        """
+        if self.collect_only:
+            return False
+
+        resource_type = self.resource_types[resource.resource_type_id]
+        issue_alert_schedule = self.get_alert_schedule(resource_type)
+
+        issue_age = now - issue_properties['created']
+        for enforcement in ('stop', 'remove'):
+            enforcement_time = parse_schedule_value(issue_alert_schedule[enforcement])
+            if enforcement_time and issue_age >= enforcement_time:
+                return True
+
+        last_alert_time = parse_schedule_value(issue_properties.get('last_alert'))
+        last_alert_time = -1 if last_alert_time is None else last_alert_time
+        return any(
+            last_alert_time < alert_time <= issue_age
+            for alert_time in map(parse_schedule_value, issue_alert_schedule['alert'])
+        )
+
+    def create_new_issues(self, new_issues):
+        """Create the issues for newly found non-compliant resources. Each issue is created in a savepoint and
+        committed together with the rest of the batch by the caller
+
+        Args:
+            new_issues (`dict`): Non-compliant resources, as returned by `get_resources`
+
+        Returns:
+            generator of :obj:`RequiredTagsIssue`
+        """
+        for non_compliant_resource in new_issues.values():
+            try:
                 properties = {
                     'resource_id': non_compliant_resource['resource_id'],
                     'account_id': non_compliant_resource['resource'].account_id,
@@ -175,16 +947,126 @@ class RequiredTagsAuditor(BaseAuditor):
                     'notes': non_compliant_resource['notes'],
                     'resource_type': non_compliant_resource['resource'].resource_name
                 }
-                issue = RequiredTagsIssue.create(non_compliant_resource['issue_id'], properties=properties)
-                self.log.info('Trying to add new issue / {} {}'.format(properties['resource_id'], str(issue)))
-                db.session.add(issue.issue)
-                db.session.commit()
-                yield issue
-        except Exception as e:
-            self.log.info('Could not add new issue / {}'.format(e))
+                with db.session.begin_nested():
+                    issue = RequiredTagsIssue.create(non_compliant_resource['issue_id'], properties=properties)
+                    self.log.info('Trying to add new issue / {} {}'.format(properties['resource_id'], str(issue)))
+                    db.session.add(issue.issue)
+                    save_snapshot(issue)
+            except Exception as e:
+                self.log.info('Could not add new issue / {}'.format(e))
+                continue
+
+            yield issue
+
+    def get_forecast_data(self, shard_only=False):
+        """Load the data required to forecast enforcement for all known issues, in column oriented form
+
+        Args:
+            shard_only (`bool`): Only include issues in the shards handled by this worker
+
+        Returns:
+            `dict` of `list`
+        """
+        return self.load_forecast_data(self.resource_types, self.audited_types, self.in_shard if shard_only else None)
+
+    @classmethod
+    def load_forecast_data(cls, resource_types, audited_types, in_shard=None):
+        """Load the data required to forecast enforcement for all known issues, in column oriented form
+
+        Reads the issue properties and resource information straight from the database, without creating issue or
+        resource objects. Does not require an auditor instance
+
+        Args:
+            resource_types (`dict`): Mapping of resource type IDs to resource type names
+            audited_types (`list` of `str`): Names of the audited resource types
+            in_shard (`callable`): Returns `True` for the IDs of the issues to include, defaults to all issues
+
+        Returns:
+            `dict` of `list`
+        """
+        issue_data = cls.get_issue_properties(('resource_id', 'created', 'last_alert'))
+        try:
+            resources = {
+                resource_id: (account_name, resource_types[resource_type_id])
+                for resource_id, resource_type_id, account_name in db.session.query(
+                    Resource.resource_id, Resource.resource_type_id, Account.account_name
+                ).join(
+                    Account, Account.account_id == Resource.account_id
+                ).filter(
+                    Resource.resource_type_id.in_(
+                        [type_id for type_id, name in resource_types.items() if name in audited_types]
+                    )
+                )
+            }
         finally:
             db.session.rollback()
 
+        forecast_data = {
+            'issue_id': [], 'resource_id': [], 'created': [], 'last_alert': [], 'account': [], 'resource_type': []
+        }
+        for issue_id, issue in issue_data.items():
+            # Issues for resources which no longer exist are removed on the next run, without any action
+            if issue.get('resource_id') not in resources or (in_shard and not in_shard(issue_id)):
+                continue
+
+            account_name, resource_type = resources[issue['resource_id']]
+            forecast_data['issue_id'].append(issue_id)
+            forecast_data['resource_id'].append(issue['resource_id'])
+            forecast_data['created'].append(issue['created'])
+            forecast_data['last_alert'].append(issue.get('last_alert'))
+            forecast_data['account'].append(account_name)
+            forecast_data['resource_type'].append(resource_type)
+
+        return forecast_data
+
+    def forecast(self, horizon=30, now=None):
+        """Forecast the alerts, stops and removals the auditor would perform over the next `horizon` days
+
+        The forecast ignores the `collect_only` setting and does not modify any issues, making it safe to run before
+        enabling enforcement
+
+        Args:
+            horizon (`int`): Number of days to forecast
+            now (`float`): Start time of the forecast, defaults to the current time
+
+        Returns:
+            `dict` mapping account names to the per-day `alert`, `stop` and `remove` counts
+        """
+        return forecast_enforcement(self.get_forecast_data(), self.alert_schedule, horizon, now)
+
+    @classmethod
+    def forecast_from_config(cls, horizon=30, now=None):
+        """Forecast the alerts, stops and removals over the next `horizon` days, using the stored configuration
+
+        Unlike `forecast`, this does not create an auditor, so it does not create the tables of the auditor, configure
+        the enforcement journal nor register as a shard worker
+
+        Args:
+            horizon (`int`): Number of days to forecast
+            now (`float`): Start time of the forecast, defaults to the current time
+
+        Returns:
+            `dict` mapping account names to the per-day `alert`, `stop` and `remove` counts
+        """
+        try:
+            resource_types = {
+                resource_type.resource_type_id: resource_type.resource_type
+                for resource_type in db.ResourceType.find()
+            }
+        finally:
+            db.session.rollback()
+
+        forecast_data = cls.load_forecast_data(
+            resource_types,
+            dbconfig.get('audit_scope', NS_AUDITOR_REQUIRED_TAGS)['enabled']
+        )
+        return forecast_enforcement(
+            forecast_data,
+            dbconfig.get('alert_settings', NS_AUDITOR_REQUIRED_TAGS),
+            horizon,
+            now
+        )
+
     def get_contacts(self, issue):
         """Returns a list of contacts for an issue
 
@@ -210,24 +1092,19 @@ class RequiredTagsAuditor(BaseAuditor):
         return account_contacts
 
     def get_actions(self, issues):
-        """Returns a list of actions to executed
+        """Generates the actions to execute
 
         Args:
-            issues (`list` of :obj:`RequiredTagsIssue`): List of issues
+            issues (iterable of :obj:`RequiredTagsIssue`): Issues to determine the actions for
 
         Returns:
-            `list` of `dict`
+            generator of :obj:`AuditAction`
         """
-        actions = []
-        try:
-            for issue in issues:
-                action_item = self.determine_action(issue)
-                if action_item['action'] != AuditActions.IGNORE:
-                    action_item['owners'] = self.get_contacts(issue)
-                    actions.append(action_item)
-        finally:
-            db.session.rollback()
-        return actions
+        for issue in issues:
+            action_item = self.determine_action(issue)
+            if action_item.action != AuditActions.IGNORE:
+                action_item.owners = self.contact_cache.get(self.get_contacts(issue))
+                yield action_item
 
     def determine_alert(self, action_schedule, issue_creation_time, last_alert):
         """Determine if we need to trigger an alert
@@ -259,45 +1136,43 @@ class RequiredTagsAuditor(BaseAuditor):
             issue: Issue to determine action for
 
         Returns:
-             `dict`
+             :obj:`AuditAction`
         """
         resource_type = self.resource_types[issue.resource.resource_type_id]
-        issue_alert_schedule = self.alert_schedule[resource_type] if \
-            resource_type in self.alert_schedule \
-            else self.alert_schedule['*']
+        issue_alert_schedule = self.get_alert_schedule(resource_type)
 
-        action_item = {
-            'action': None,
-            'action_description': None,
-            'last_alert': issue.last_alert,
-            'issue': issue,
-            'resource': issue.resource,
-            'owners': [],
-            'stop_after': issue_alert_schedule['stop'],
-            'remove_after': issue_alert_schedule['remove'],
-            'notes': issue.notes,
-            'missing_tags': issue.missing_tags
-        }
+        action_item = AuditAction(
+            None,
+            issue,
+            issue.resource,
+            last_alert=issue.last_alert,
+            stop_after=issue_alert_schedule['stop'],
+            remove_after=issue_alert_schedule['remove'],
+            notes=issue.notes,
+            missing_tags=issue.missing_tags
+        )
 
         time_elapsed = time.time() - issue.created
         stop_schedule = pytimeparse.parse(issue_alert_schedule['stop'])
         remove_schedule = pytimeparse.parse(issue_alert_schedule['remove'])
 
         if self.collect_only:
-            action_item['action'] = AuditActions.IGNORE
+            action_item.action = AuditActions.IGNORE
         elif remove_schedule and time_elapsed >= remove_schedule:
-            action_item['action'] = AuditActions.REMOVE
-            action_item['action_description'] = 'Resource removed'
-            action_item['last_alert'] = remove_schedule
+            action_item.action = AuditActions.REMOVE
+            action_item.action_description = 'Resource removed'
+            action_item.last_alert = remove_schedule
             if issue.update({'last_alert': remove_schedule}):
                 db.session.add(issue.issue)
+                save_snapshot(issue)
 
         elif stop_schedule and time_elapsed >= stop_schedule:
-            action_item['action'] = AuditActions.STOP
-            action_item['action_description'] = 'Resource stopped'
-            action_item['last_alert'] = stop_schedule
+            action_item.action = AuditActions.STOP
+            action_item.action_description = 'Resource stopped'
+            action_item.last_alert = stop_schedule
             if issue.update({'last_alert': stop_schedule}):
                 db.session.add(issue.issue)
+                save_snapshot(issue)
 
         else:
             alert_selection = self.determine_alert(
@@ -306,91 +1181,191 @@ class RequiredTagsAuditor(BaseAuditor):
                 issue.get_property('last_alert').value
             )
             if alert_selection:
-                action_item['action'] = AuditActions.ALERT
-                action_item['action_description'] = '{} alert'.format(alert_selection)
-                action_item['last_alert'] = alert_selection
+                action_item.action = AuditActions.ALERT
+                action_item.action_description = '{} alert'.format(alert_selection)
+                action_item.last_alert = alert_selection
                 if issue.update({'last_alert': alert_selection}):
                     db.session.add(issue.issue)
+                    save_snapshot(issue)
             else:
-                action_item['action'] = AuditActions.IGNORE
+                action_item.action = AuditActions.IGNORE
 
-        db.session.commit()
+        # Committed together with the rest of the batch by the caller
         return action_item
 
-    def process_actions(self, actions):
+    def process_actions(self, actions, notices=None):
         """Process the actions we want to take
 
+        Actions are processed in batches of `action_batch_size`. The changes made by a batch are committed together
+        with the checkpoint of the completed actions and their notices, once the last action of the batch is done
+
         Args:
-            actions (`list`): List of actions we want to take
+            actions (iterable of :obj:`AuditAction`): Actions we want to take, consumed one batch at a time
+            notices (`dict`): Notices of actions completed by an earlier attempt of the run, to add the new notices to
 
         Returns:
-            `list` of notifications
+            `dict` mapping contacts to the `fixed` and `not_fixed` lists of :obj:`Notice`
         """
-        notices = {}
-        notification_contacts = {}
+        notices = notices if notices is not None else {}
+        completed = {}
         try:
-            for action in actions:
-                resource = action['resource']
-
-                try:
-                    with suppress(ResourceActionError):
-                        if action['action'] == AuditActions.REMOVE:
-                            if process_action(resource, 'kill', self.resource_types[resource.resource_type_id]):
-                                db.session.delete(action['issue'].issue)
-
-                        elif action['action'] == AuditActions.STOP:
-                            if process_action(resource, 'stop', self.resource_types[resource.resource_type_id]):
-                                action['issue'].update({
-                                    'missing_tags': action['missing_tags'],
-                                    'notes': action['notes'],
-                                    'last_alert': action['last_alert'],
-                                    'state': action['action']
-                                })
-
-                            else:
-                                # Resource is already stopped, so we are gonna skip the notification for it
-                                continue
-
-                        elif action['action'] == AuditActions.FIXED:
-                            db.session.delete(action['issue'].issue)
-
-                        elif action['action'] == AuditActions.ALERT:
-                            action['issue'].update({
-                                'missing_tags': action['missing_tags'],
-                                'notes': action['notes'],
-                                'last_alert': action['last_alert'],
-                                'state': action['action']
-                            })
-                        db.session.commit()
-
-                        for owner in action['owners'] + self.permanent_emails:
-                            if owner['value'] not in notification_contacts:
-                                contact = NotificationContact(type=owner['type'], value=owner['value'])
-                                notification_contacts[owner['value']] = contact
-                                notices[contact] = {
-                                    'fixed': [],
-                                    'not_fixed': []
-                                }
-                            else:
-                                contact = notification_contacts[owner['value']]
-
-                            if action['action'] == AuditActions.FIXED:
-                                notices[contact]['fixed'].append(action)
-                            else:
-                                notices[contact]['not_fixed'].append(action)
-
-                except Exception as ex:
-                    self.log.exception('Unexpected error while processing resource {}/{}/{}/{}'.format(
-                        action['resource'].account.account_name,
-                        action['resource'].resource_id,
-                        action['resource'],
-                        ex
-                    ))
+            for batch in self.reconcile_live_states(actions):
+                for action in batch:
+                    completed[action.issue.id] = self.process_action(action)
+                    if completed[action.issue.id]:
+                        add_notice(notices, *completed[action.issue.id])
+
+                self.record_completed(completed)
+                db.session.commit()
+                enforcement_journal.flush_if_due()
         finally:
             db.session.rollback()
+            # Never raises, so a database error can not prevent the notifications from being sent
+            enforcement_journal.flush_if_due(force=True)
 
         return notices
 
+    def process_action(self, action):
+        """Process a single action, in a savepoint of the batch transaction
+
+        Args:
+            action (:obj:`AuditAction`): Action to take
+
+        Returns:
+            `(Notice, tuple)` - The notice for the action and the contacts to send it to, or `None` if no notice should
+            be sent
+        """
+        resource = action.resource
+        action_kwargs = {'state': action.live_state} if action.live_state else {}
+
+        # Skip stopping resources which are already stopped or gone. Resources to remove which are already gone
+        # are handled as removed below, so their issue is deleted
+        if action.action == AuditActions.STOP and action.live_state in SKIP_LIVE_STATES[AuditActions.STOP]:
+            self.log.debug('Skipping {} of {}, resource is {}'.format(
+                action.action,
+                resource.resource_id,
+                action.live_state
+            ))
+            return None
+
+        # Make sure the shard is still ours before enforcing, another worker may have taken it over
+        if self.coordinator and action.action in (AuditActions.REMOVE, AuditActions.STOP):
+            if self.listening:
+                self.log.debug('Leaving the {} of {} to the worker holding its shard'.format(
+                    action.action,
+                    action.issue.id
+                ))
+                return None
+
+            if not self.coordinator.verify_key(action.issue.id):
+                self.log.warning('Lost the shard lease for {}, skipping enforcement'.format(action.issue.id))
+                return None
+
+        try:
+            # Taken before the action is processed, as removing the resource also deletes the issue
+            notice = Notice.from_action(action)
+
+            # Each action runs in a savepoint, the session itself is committed once per batch
+            with db.session.begin_nested():
+                with suppress(ResourceActionError):
+                    if action.action == AuditActions.REMOVE:
+                        if action.live_state in SKIP_LIVE_STATES[AuditActions.REMOVE] or process_action(
+                            resource, 'kill', self.resource_types[resource.resource_type_id], **action_kwargs
+                        ):
+                            db.session.delete(action.issue.issue)
+                            delete_snapshot(action.issue.id)
+
+                    elif action.action == AuditActions.STOP:
+                        if process_action(
+                            resource, 'stop', self.resource_types[resource.resource_type_id], **action_kwargs
+                        ):
+                            action.issue.update({
+                                'missing_tags': action.missing_tags,
+                                'notes': action.notes,
+                                'last_alert': action.last_alert,
+                                'state': action.action
+                            })
+                            save_snapshot(action.issue)
+
+                        else:
+                            # Resource is already stopped, so we are gonna skip the notification for it
+                            return None
+
+                    elif action.action == AuditActions.FIXED:
+                        db.session.delete(action.issue.issue)
+                        delete_snapshot(action.issue.id)
+
+                    elif action.action == AuditActions.ALERT:
+                        action.issue.update({
+                            'missing_tags': action.missing_tags,
+                            'notes': action.notes,
+                            'last_alert': action.last_alert,
+                            'state': action.action
+                        })
+                        save_snapshot(action.issue)
+
+                    return notice, tuple(action.owners) + tuple(self.permanent_emails)
+
+        except Exception as ex:
+            self.log.exception('Unexpected error while processing resource {}/{}/{}/{}'.format(
+                action.resource.account.account_name,
+                action.resource.resource_id,
+                action.resource,
+                ex
+            ))
+
+        return None
+
+    def record_completed(self, completed):
+        """Checkpoint the completed actions of a batch and their notices, if a checkpointed run is in progress
+
+        Args:
+            completed (`dict`): Mapping of the issue IDs of the completed actions to their notice and contacts, as
+                returned by `process_action`. Emptied once recorded
+
+        Returns:
+            `None`
+        """
+        if self.checkpoint:
+            self.checkpoint.record_completed(completed)
+        completed.clear()
+
+    def reconcile_live_states(self, actions):
+        """Fetch the live state of the resources to enforce, one batch of actions at a time
+
+        The live state is fetched with one call per resource type, account and region for the whole batch, instead of
+        relying on the cached state which can be up to a collection cycle out of date
+
+        Args:
+            actions (iterable of :obj:`AuditAction`): Actions to process
+
+        Returns:
+            generator of `list` of :obj:`AuditAction`, with `live_state` set where it could be determined
+        """
+        actions = iter(actions)
+        while True:
+            batch = list(islice(actions, self.action_batch_size))
+            if not batch:
+                return
+
+            resources = defaultdict(list)
+            for action in batch:
+                if action.action in SKIP_LIVE_STATES and action.resource:
+                    resources[self.resource_types[action.resource.resource_type_id]].append(action.resource)
+
+            live_states = {}
+            for resource_type, type_resources in resources.items():
+                live_states.update(get_live_states(type_resources, resource_type))
+
+            for action in batch:
+                if action.resource:
+                    action.live_state = live_states.get(action.resource.resource_id)
+
+            if self.checkpoint:
+                self.checkpoint.record_decided(batch)
+
+            yield batch
+
     def check_required_tags_compliance(self, resource):
         """Check whether a resource is compliance
 
@@ -424,12 +1399,17 @@ class RequiredTagsAuditor(BaseAuditor):
             return missing_tags, notes
         '''
 
-        # Check if the resource is missing required tags
-        for key in [tag.lower() for tag in self.required_tags]:
+        # Check if the resource is missing any of the tags required by the policies applying to it
+        required_tags = self.policy_index.get_required_tags(
+            resource.resource_type,
+            resource.account.account_name,
+            resource.location
+        )
+        for key in required_tags:
             if key not in resource_tags:
                 missing_tags.append(key)
 
-            elif key == 'owner' and not validate_email(resource_tags[key], self.partial_owner_match):
+            elif key == 'owner' and not self.owner_validator.validate(resource_tags[key], self.partial_owner_match):
                 missing_tags.append(key)
                 notes.append('Owner tag is not a valid email address')
 
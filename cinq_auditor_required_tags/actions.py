@@ -0,0 +1,257 @@
+from collections import namedtuple
+
+
+class AuditAction(object):
+    """Compact record of an action to take for an issue
+
+    Supports item access (`action['resource']`) in addition to attribute access, so notification templates written
+    for the previous dictionary based actions keep working
+    """
+    __slots__ = (
+        'action', 'action_description', 'last_alert', 'issue', 'resource', 'owners', 'stop_after', 'remove_after',
+        'notes', 'missing_tags', 'live_state'
+    )
+
+    def __init__(self, action, issue, resource, owners=(), action_description=None, last_alert=None,
+                 stop_after=None, remove_after=None, notes=None, missing_tags=None, live_state=None):
+        self.action = action
+        self.action_description = action_description
+        self.last_alert = last_alert
+        self.issue = issue
+        self.resource = resource
+        self.owners = owners
+        self.stop_after = stop_after
+        self.remove_after = remove_after
+        self.notes = notes
+        self.missing_tags = missing_tags
+        self.live_state = live_state
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return '<AuditAction {} {}>'.format(self.action, getattr(self.issue, 'id', None))
+
+
+class ContactCache(object):
+    """Interns contact lists, so actions with the same contacts share a single tuple of `(type, value)` tuples"""
+
+    def __init__(self):
+        self.contacts = {}
+
+    def get(self, contacts):
+        """Returns the shared tuple for a list of contacts
+
+        Args:
+            contacts (`list` of `dict`): List of contacts, with the `type` and `value` keys
+
+        Returns:
+            `tuple` of `(str, str)`
+        """
+        key = tuple((contact['type'], contact['value']) for contact in contacts)
+        return self.contacts.setdefault(key, key)
+
+    def clear(self):
+        self.contacts = {}
+
+
+NoticeAccount = namedtuple('NoticeAccount', ('account_name',))
+NoticeTag = namedtuple('NoticeTag', ('key', 'value'))
+
+
+class NoticeResource(object):
+    """Compact copy of the resource fields used by the notification templates"""
+    __slots__ = ('resource_id', 'resource_type', 'location', 'account', 'tags', 'name')
+
+    def __init__(self, resource_id, resource_type=None, location=None, account_name=None, tags=(), name=None):
+        self.resource_id = resource_id
+        self.resource_type = resource_type
+        self.location = location
+        self.account = NoticeAccount(account_name)
+        self.tags = tuple(NoticeTag(key, value) for key, value in tags)
+        self.name = name
+
+    @classmethod
+    def from_resource(cls, resource):
+        """Copy the fields of a resource
+
+        Args:
+            resource (:obj:`Resource`): Resource to copy
+
+        Returns:
+            :obj:`NoticeResource`
+        """
+        return cls(
+            resource.resource_id,
+            resource_type=getattr(resource, 'resource_name', None),
+            location=resource.location,
+            account_name=resource.account.account_name,
+            tags=((tag.key, tag.value) for tag in resource.tags),
+            name=resource.get_name_or_id() if hasattr(resource, 'get_name_or_id') else None
+        )
+
+    def get_name_or_id(self):
+        return self.name or self.resource_id
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def to_json(self):
+        return {
+            'resourceId': self.resource_id,
+            'resourceType': self.resource_type,
+            'location': self.location,
+            'accountName': self.account.account_name,
+            'tags': [list(tag) for tag in self.tags],
+            'name': self.name
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data['resourceId'],
+            resource_type=data['resourceType'],
+            location=data['location'],
+            account_name=data['accountName'],
+            tags=data['tags'],
+            name=data['name']
+        )
+
+
+class NoticeIssue(object):
+    """Compact copy of the issue properties used by the notification templates"""
+    __slots__ = (
+        'id', 'resource_id', 'resource_type', 'account_id', 'location', 'state', 'created', 'last_alert',
+        'missing_tags', 'notes'
+    )
+    PROPERTIES = __slots__[1:]
+
+    def __init__(self, issue_id, **properties):
+        self.id = issue_id
+        for name in self.PROPERTIES:
+            setattr(self, name, properties.get(name))
+
+    @property
+    def issue_id(self):
+        return self.id
+
+    @classmethod
+    def from_issue(cls, issue):
+        """Copy the properties of an issue
+
+        Args:
+            issue (:obj:`RequiredTagsIssue`): Issue to copy
+
+        Returns:
+            :obj:`NoticeIssue`
+        """
+        properties = {prop.name: prop.value for prop in issue.issue.properties}
+        return cls(issue.id, **{name: properties.get(name) for name in cls.PROPERTIES})
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def to_json(self):
+        return dict({name: getattr(self, name) for name in self.PROPERTIES}, id=self.id)
+
+    @classmethod
+    def from_json(cls, data):
+        data = dict(data)
+        return cls(data.pop('id'), **data)
+
+
+class Notice(object):
+    """Compact, JSON serializable record of a processed action, used to render the notifications
+
+    Unlike :obj:`AuditAction` it holds no reference to the issue or resource objects, but compact copies of the
+    fields the notification templates read from them (`issue['issue'].resource_type`, `issue['resource'].resource_id`).
+    A single notice is shared between all contacts of the action
+    """
+    __slots__ = (
+        'issue_id', 'action', 'action_description', 'last_alert', 'stop_after', 'remove_after', 'missing_tags',
+        'notes', 'resource', 'issue'
+    )
+
+    def __init__(self, issue_id, action, resource, action_description=None, last_alert=None, stop_after=None,
+                 remove_after=None, missing_tags=None, notes=None, issue=None):
+        self.issue_id = issue_id
+        self.action = action
+        self.resource = resource
+        self.issue = issue or NoticeIssue(issue_id)
+        self.action_description = action_description
+        self.last_alert = last_alert
+        self.stop_after = stop_after
+        self.remove_after = remove_after
+        self.missing_tags = missing_tags
+        self.notes = notes
+
+    @classmethod
+    def from_action(cls, action):
+        """Create the notice for an action. Must be called before the action is processed, as processing may delete
+        the issue
+
+        Args:
+            action (:obj:`AuditAction`): Processed action
+
+        Returns:
+            :obj:`Notice`
+        """
+        return cls(
+            action.issue.id,
+            action.action,
+            NoticeResource.from_resource(action.resource) if action.resource else None,
+            action_description=action.action_description,
+            last_alert=action.last_alert,
+            stop_after=action.stop_after,
+            remove_after=action.remove_after,
+            missing_tags=action.missing_tags,
+            notes=action.notes,
+            issue=NoticeIssue.from_issue(action.issue)
+        )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return '<Notice {} {}>'.format(self.action, self.issue_id)
+
+    def to_json(self):
+        return {
+            'issueId': self.issue_id,
+            'action': self.action,
+            'resource': self.resource.to_json() if self.resource else None,
+            'actionDescription': self.action_description,
+            'lastAlert': self.last_alert,
+            'stopAfter': self.stop_after,
+            'removeAfter': self.remove_after,
+            'missingTags': self.missing_tags,
+            'notes': self.notes,
+            'issue': self.issue.to_json()
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data['issueId'],
+            data['action'],
+            NoticeResource.from_json(data['resource']) if data['resource'] else None,
+            action_description=data['actionDescription'],
+            last_alert=data['lastAlert'],
+            stop_after=data['stopAfter'],
+            remove_after=data['removeAfter'],
+            missing_tags=data['missingTags'],
+            notes=data['notes'],
+            issue=NoticeIssue.from_json(data['issue'])
+        )
@@ -0,0 +1,106 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+class ApiCallCounter(object):
+    """Counts the AWS API calls made while performing each type of action
+
+    The counter is registered on the `before-call` event of boto3 sessions, so every API call made by a client or
+    resource created from the session is attributed to the action tracked by the current thread. It is registered
+    ahead of any other handler, as handlers returning a response, such as the botocore `Stubber`, skip the handlers
+    after them
+    """
+    UNTRACKED = 'untracked'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls = Counter()
+        self.operations = defaultdict(Counter)
+        self.invocations = Counter()
+        self.resources = Counter()
+
+    def register(self, session):
+        """Register the counter on a boto3 session
+
+        Args:
+            session (:obj:`boto3.session.Session`): Session to count the API calls of
+
+        Returns:
+            `None`
+        """
+        session.events.register_first('before-call.*.*', self.on_call, unique_id='cinq-required-tags-api-calls')
+
+    @contextmanager
+    def track(self, action, resource_count=1):
+        """Attribute API calls made by the current thread to an action
+
+        Args:
+            action (`str`): Name of the action, such as `aws_ec2_instance.stop`
+            resource_count (`int`): Number of resources the action is performed on
+
+        Returns:
+            `None`
+        """
+        previous = getattr(self.local, 'action', None)
+        self.local.action = action
+        with self.lock:
+            self.invocations[action] += 1
+            self.resources[action] += resource_count
+
+        try:
+            yield
+        finally:
+            self.local.action = previous
+
+    def on_call(self, model=None, **kwargs):
+        """Event handler called by botocore before each API call
+
+        Args:
+            model (:obj:`botocore.model.OperationModel`): The operation being called
+
+        Returns:
+            `None`
+        """
+        action = getattr(self.local, 'action', None) or self.UNTRACKED
+        operation = '{}.{}'.format(model.service_model.service_name, model.name) if model else 'unknown'
+        with self.lock:
+            self.calls[action] += 1
+            self.operations[action][operation] += 1
+
+    def report(self):
+        """Returns the number of API calls per action
+
+        Returns:
+            `dict` mapping action names to the number of invocations, resources and API calls, the API calls per
+            invocation and per resource, and the API calls per operation
+        """
+        with self.lock:
+            return {
+                action: {
+                    'invocations': self.invocations[action],
+                    'resources': self.resources[action],
+                    'calls': self.calls[action],
+                    'calls_per_action': self.calls[action] / self.invocations[action]
+                    if self.invocations[action] else None,
+                    'calls_per_resource': self.calls[action] / self.resources[action]
+                    if self.resources[action] else None,
+                    'operations': dict(self.operations[action])
+                } for action in set(self.calls) | set(self.invocations)
+            }
+
+    def reset(self):
+        """Reset all counters
+
+        Returns:
+            `None`
+        """
+        with self.lock:
+            self.calls.clear()
+            self.operations.clear()
+            self.invocations.clear()
+            self.resources.clear()
+
+
+api_calls = ApiCallCounter()
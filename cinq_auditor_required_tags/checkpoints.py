@@ -0,0 +1,291 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from cinq_auditor_required_tags.schema import AuditRun, AuditRunAction
+from cloud_inquisitor.database import db
+
+logger = logging.getLogger(__name__)
+
+PHASE_STARTED = 'started'
+PHASE_SCANNED = 'scanned'
+PHASE_FINISHED = 'finished'
+PHASE_ABANDONED = 'abandoned'
+
+
+def get_latest_generation(worker_key=None):
+    """Returns the generation of the most recently finished auditor run
+
+    Args:
+        worker_key (`str`): Only consider runs by workers handling this set of issues
+
+    Returns:
+        `int` or `None`
+    """
+    query = db.session.query(func.max(AuditRun.generation)).filter(AuditRun.phase == PHASE_FINISHED)
+    if worker_key:
+        query = query.filter(AuditRun.worker_key == worker_key)
+
+    return query.scalar()
+
+
+def get_schedule(worker_key, config_version):
+    """Returns the adaptive schedule saved by the most recently finished run of a worker
+
+    Args:
+        worker_key (`str`): Identifies the set of issues handled by the worker
+        config_version (`str`): Hash of the auditor configuration, schedules saved with another configuration are
+            ignored
+
+    Returns:
+        `tuple` of the generation of the run, and the times of the next full run and the next deadline, all of which
+        are `None` if there is no such run
+    """
+    try:
+        run = db.session.query(AuditRun).filter(
+            AuditRun.worker_key == worker_key,
+            AuditRun.phase == PHASE_FINISHED
+        ).order_by(AuditRun.generation.desc()).first()
+    finally:
+        db.session.rollback()
+
+    if not run or run.config_version != config_version:
+        return None, None, None
+
+    return run.generation, run.next_full_run, run.next_deadline
+
+
+def save_schedule(generation, next_full_run, next_deadline):
+    """Save the adaptive schedule of a worker on its most recently finished run
+
+    Args:
+        generation (`int`): Generation of the run
+        next_full_run (`float`): Time of the next full run
+        next_deadline (`float`): Time of the next alert or enforcement deadline, or `None`
+
+    Returns:
+        `None`
+    """
+    try:
+        db.session.query(AuditRun).filter(
+            AuditRun.generation == generation
+        ).update({'next_full_run': next_full_run, 'next_deadline': next_deadline}, synchronize_session=False)
+        db.session.commit()
+    finally:
+        db.session.rollback()
+
+
+def prune_runs(max_age):
+    """Delete the runs last updated more than `max_age` seconds ago, and their action records. The latest finished run
+    of every worker is kept, as it holds the schedule of the worker and is the base of its next run
+
+    Args:
+        max_age (`int`): Number of seconds to keep runs for
+
+    Returns:
+        `int` - Number of runs deleted
+    """
+    try:
+        keep = {
+            generation for generation, in db.session.query(func.max(AuditRun.generation)).filter(
+                AuditRun.phase == PHASE_FINISHED
+            ).group_by(AuditRun.worker_key)
+        }
+        generations = [
+            generation for generation, in db.session.query(AuditRun.generation).filter(
+                AuditRun.updated < datetime.utcnow() - timedelta(seconds=max_age)
+            ) if generation not in keep
+        ]
+        for idx in range(0, len(generations), 500):
+            batch = generations[idx:idx + 500]
+            db.session.query(AuditRunAction).filter(
+                AuditRunAction.generation.in_(batch)
+            ).delete(synchronize_session=False)
+            db.session.query(AuditRun).filter(AuditRun.generation.in_(batch)).delete(synchronize_session=False)
+
+        db.session.commit()
+        return len(generations)
+    finally:
+        db.session.rollback()
+
+
+class RunCheckpoint(object):
+    """Checkpoints of a single auditor run, allowing an interrupted run to be resumed
+
+    A run records its scan results once the scan is complete, and the actions it decides on and completes as each
+    batch of actions is processed. An unfinished run is resumed if it was started by a worker handling the same issues,
+    with the same configuration, no run by such a worker has finished since, and it was last updated less than
+    `max_age` ago
+    """
+
+    def __init__(self, run, resumed=False):
+        self.run = run
+        self.resumed = resumed
+        self.recorded = set()
+
+    @classmethod
+    def start(cls, worker_key, config_version, max_age):
+        """Resume the latest unfinished run for the worker if possible, else start a new run
+
+        Args:
+            worker_key (`str`): Identifies the set of issues handled by the worker
+            config_version (`str`): Hash of the auditor configuration
+            max_age (`int`): Maximum age of a checkpoint to resume from, in seconds
+
+        Returns:
+            :obj:`RunCheckpoint`
+        """
+        now = datetime.utcnow()
+        try:
+            base_generation = get_latest_generation(worker_key)
+            unfinished = db.session.query(AuditRun).filter(
+                AuditRun.worker_key == worker_key,
+                AuditRun.phase.in_((PHASE_STARTED, PHASE_SCANNED))
+            ).order_by(AuditRun.generation.desc()).all()
+
+            for run in unfinished:
+                if run is unfinished[0] and run.config_version == config_version \
+                        and run.base_generation == base_generation and run.updated >= now - timedelta(seconds=max_age):
+                    logger.info('Resuming auditor run {} from phase {}'.format(run.generation, run.phase))
+                    return cls(run, resumed=True)
+
+                run.phase = PHASE_ABANDONED
+                run.scan = None
+                db.session.query(AuditRunAction).filter(
+                    AuditRunAction.generation == run.generation
+                ).delete(synchronize_session=False)
+                db.session.add(run)
+
+            run = AuditRun(
+                worker_key=worker_key,
+                config_version=config_version,
+                base_generation=base_generation,
+                phase=PHASE_STARTED,
+                started=now,
+                updated=now
+            )
+            db.session.add(run)
+            db.session.commit()
+            return cls(run)
+        finally:
+            db.session.rollback()
+
+    @property
+    def generation(self):
+        return self.run.generation
+
+    @property
+    def scan(self):
+        """Returns the recorded scan results, or `None` if the scan has not completed
+
+        Returns:
+            `dict` or `None`
+        """
+        return self.run.scan if self.run.phase == PHASE_SCANNED else None
+
+    def save_scan(self, scan):
+        """Record the scan results
+
+        Args:
+            scan (`dict`): Issue IDs of the known, fixed and new issues found by the scan
+
+        Returns:
+            `None`
+        """
+        self.run.scan = scan
+        self.run.phase = PHASE_SCANNED
+        self.run.updated = datetime.utcnow()
+        db.session.add(self.run)
+        db.session.commit()
+
+    def get_actions(self):
+        """Returns the actions decided on by the run so far
+
+        Returns:
+            `dict` mapping issue IDs to :obj:`AuditRunAction` records
+        """
+        actions = {
+            action.issue_id: action for action in db.session.query(AuditRunAction).filter(
+                AuditRunAction.generation == self.generation
+            )
+        }
+        self.recorded.update(actions)
+
+        return actions
+
+    def record_decided(self, actions):
+        """Record a batch of decided actions
+
+        Args:
+            actions (`list` of :obj:`AuditAction`): Decided actions
+
+        Returns:
+            `None`
+        """
+        # Actions resumed from an earlier attempt of the run are already recorded
+        actions = [action for action in actions if action.issue.id not in self.recorded]
+        self.recorded.update(action.issue.id for action in actions)
+
+        db.session.bulk_insert_mappings(AuditRunAction, [
+            {
+                'generation': self.generation,
+                'issue_id': action.issue.id,
+                'action': str(action.action),
+                'action_description': action.action_description,
+                'last_alert': None if action.last_alert is None else str(action.last_alert),
+                'completed': False
+            } for action in actions
+        ])
+        self.touch()
+        db.session.commit()
+
+    def record_completed(self, completed):
+        """Mark a batch of actions as completed, storing the notice of each action so it can be sent if the run is
+        resumed. Committed together with the changes made by the actions
+
+        Args:
+            completed (`dict`): Mapping of the issue IDs of the completed actions to a tuple of the :obj:`Notice` and
+                the contacts to send it to, or `None` for actions without a notice
+
+        Returns:
+            `None`
+        """
+        if completed:
+            db.session.bulk_update_mappings(AuditRunAction, [
+                {
+                    'generation': self.generation,
+                    'issue_id': issue_id,
+                    'completed': True,
+                    'notice': {
+                        'notice': notice[0].to_json(),
+                        'contacts': [list(contact) for contact in notice[1]]
+                    } if notice else None
+                } for issue_id, notice in completed.items()
+            ])
+            self.touch()
+
+    def touch(self):
+        db.session.query(AuditRun).filter(
+            AuditRun.generation == self.generation
+        ).update({'updated': datetime.utcnow()}, synchronize_session=False)
+
+    def finish(self):
+        """Mark the run as finished and remove its scan results and action records
+
+        Returns:
+            `None`
+        """
+        try:
+            db.session.query(AuditRunAction).filter(
+                AuditRunAction.generation == self.generation
+            ).delete(synchronize_session=False)
+            db.session.query(AuditRun).filter(
+                AuditRun.generation == self.generation
+            ).update(
+                {'phase': PHASE_FINISHED, 'updated': datetime.utcnow(), 'scan': None},
+                synchronize_session=False
+            )
+            db.session.commit()
+        finally:
+            db.session.rollback()
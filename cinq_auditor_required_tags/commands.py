@@ -0,0 +1,49 @@
+import json
+
+from flask_script import Option
+
+from cloud_inquisitor.plugins.commands import BaseCommand
+
+
+class RequiredTagsListener(BaseCommand):
+    """Audit resources as soon as their change events arrive on the configured event queue"""
+    name = 'RequiredTagsListener'
+    option_list = (
+        Option('--wait-time', dest='wait_time', type=int, default=20,
+               help='Number of seconds to wait for new events on each poll'),
+    )
+
+    def run(self, **kwargs):
+        # Imported here, as loading the auditor requires the database to be configured
+        from cinq_auditor_required_tags import RequiredTagsAuditor
+
+        RequiredTagsAuditor().listen(wait_time=kwargs['wait_time'])
+
+
+class RequiredTagsForecast(BaseCommand):
+    """Forecast the alerts, stops and removals of the Required Tags auditor, without changing anything"""
+    name = 'RequiredTagsForecast'
+    option_list = (
+        Option('--horizon', dest='horizon', type=int, default=30, help='Number of days to forecast'),
+        Option('--json', dest='json', action='store_true', default=False,
+               help='Print the per-day counts of every account as JSON'),
+    )
+
+    def run(self, **kwargs):
+        # Imported here, as loading the auditor requires the database to be configured
+        from cinq_auditor_required_tags import RequiredTagsAuditor
+
+        forecast = RequiredTagsAuditor.forecast_from_config(kwargs['horizon'])
+        if kwargs['json']:
+            print(json.dumps(forecast, indent=4, sort_keys=True))
+            return
+
+        self.log.info('--- Required Tags forecast for the next {} days ---'.format(kwargs['horizon']))
+        for account, counts in sorted(forecast.items()):
+            self.log.info('{}: {} alerts, {} stops, {} removals'.format(
+                account,
+                sum(counts['alert']),
+                sum(counts['stop']),
+                sum(counts['remove'])
+            ))
+        self.log.info('--- End of forecast ---')
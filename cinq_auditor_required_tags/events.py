@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import queue
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from itertools import count
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Maximum visibility timeout of an SQS message, in seconds
+MAX_VISIBILITY_TIMEOUT = 43200
+
+ResourceEvent = namedtuple('ResourceEvent', ('resource_type', 'resource_id', 'receipt', 'sent'))
+
+
+class InvalidEventError(ValueError):
+    """Raised for event messages which can not be parsed"""
+
+
+def parse_event(body, receipt=None, sent=None):
+    """Parse a resource change event message
+
+    Args:
+        body (`str` or `dict`): The event, either as a JSON string or an already decoded dictionary with the
+            `resource_type` and `resource_id` keys, and optionally the `sent` key
+        receipt: Queue specific handle used to acknowledge the event
+        sent (`float`): Time the event was published, as a UNIX timestamp. Defaults to the `sent` key of the event
+
+    Returns:
+        :obj:`ResourceEvent`
+
+    Raises:
+        :obj:`InvalidEventError` if the message is not a valid event
+    """
+    try:
+        if isinstance(body, str):
+            body = json.loads(body)
+
+        return ResourceEvent(body['resource_type'], body['resource_id'], receipt, sent or body.get('sent'))
+    except (ValueError, KeyError, TypeError) as error:
+        raise InvalidEventError('Invalid event message {!r}: {}'.format(body, error))
+
+
+def get_visible_events(in_flight, max_events, visibility_timeout):
+    """Returns up to `max_events` received events which were neither acknowledged nor made visible again, oldest
+    first, hiding them for another `visibility_timeout` seconds
+
+    Args:
+        in_flight (`dict`): Received events by receipt, as `[visible_at, event]` pairs
+        max_events (`int`): Maximum number of events to return
+        visibility_timeout (`int`): Number of seconds before the returned events are delivered again
+
+    Returns:
+        `list` of :obj:`ResourceEvent`
+    """
+    now = time.time()
+    events = []
+    for receipt in sorted(in_flight):
+        if len(events) >= max_events:
+            break
+
+        entry = in_flight[receipt]
+        if entry[0] <= now:
+            entry[0] = now + visibility_timeout
+            events.append(entry[1])
+
+    return events
+
+
+class BaseEventQueue(ABC):
+    """Base class for queues delivering resource change events to the auditor"""
+
+    @abstractmethod
+    def receive(self, max_events=10, wait_time=0):
+        """Return up to `max_events` pending events, waiting up to `wait_time` seconds for the first one
+
+        Args:
+            max_events (`int`): Maximum number of events to return
+            wait_time (`int`): Number of seconds to wait for events if none are available
+
+        Returns:
+            `list` of :obj:`ResourceEvent`
+        """
+
+    @abstractmethod
+    def ack(self, event):
+        """Acknowledge an event, removing it from the queue
+
+        Args:
+            event (:obj:`ResourceEvent`): Event to acknowledge
+
+        Returns:
+            `None`
+        """
+
+    @abstractmethod
+    def retry(self, event, delay):
+        """Deliver an event again after `delay` seconds, instead of waiting for it to time out
+
+        Args:
+            event (:obj:`ResourceEvent`): Event to deliver again
+            delay (`int`): Number of seconds to wait before delivering the event again
+
+        Returns:
+            `None`
+        """
+
+    @abstractmethod
+    def publish(self, resource_type, resource_id):
+        """Publish a resource change event
+
+        Args:
+            resource_type (`str`): Type of the resource that changed
+            resource_id (`str`): ID of the resource that changed
+
+        Returns:
+            `None`
+        """
+
+
+class LocalEventQueue(BaseEventQueue):
+    """In-process event queue, used for testing and single process deployments
+
+    Received events are kept until they are acknowledged, and are delivered again if they were not acknowledged within
+    `visibility_timeout` seconds
+    """
+
+    def __init__(self, visibility_timeout=30):
+        self.queue = queue.Queue()
+        self.visibility_timeout = visibility_timeout
+        self.in_flight = {}
+        self.receipts = count()
+
+    def receive(self, max_events=10, wait_time=0):
+        events = get_visible_events(self.in_flight, max_events, self.visibility_timeout)
+        received = []
+        try:
+            if not events:
+                received.append(self.queue.get(timeout=wait_time) if wait_time else self.queue.get_nowait())
+
+            while len(events) + len(received) < max_events:
+                received.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        visible_at = time.time() + self.visibility_timeout
+        for event in received:
+            self.in_flight[event.receipt] = [visible_at, event]
+
+        return events + received
+
+    def ack(self, event):
+        self.in_flight.pop(event.receipt, None)
+
+    def retry(self, event, delay):
+        if event.receipt in self.in_flight:
+            self.in_flight[event.receipt][0] = time.time() + delay
+
+    def publish(self, resource_type, resource_id):
+        self.queue.put(ResourceEvent(resource_type, resource_id, next(self.receipts), time.time()))
+
+
+class FileEventQueue(BaseEventQueue):
+    """Event queue backed by a file with one JSON encoded event per line
+
+    Events are delivered again if they were not acknowledged within `visibility_timeout` seconds. The offset of the
+    oldest event which has not been acknowledged is stored next to the queue file, so events which were received but
+    not acknowledged are also delivered again after a restart
+    """
+
+    def __init__(self, path, visibility_timeout=30):
+        self.path = path
+        self.offset_path = '{}.offset'.format(path)
+        self.dead_letter_path = '{}.dead'.format(path)
+        self.visibility_timeout = visibility_timeout
+        self.read_offset = self.offset = self._load_offset()
+        # Received events which have not been acknowledged, by their offset in the queue file
+        self.in_flight = {}
+
+    def receive(self, max_events=10, wait_time=0):
+        events = get_visible_events(self.in_flight, max_events, self.visibility_timeout)
+        if len(events) >= max_events or not os.path.exists(self.path):
+            return events
+
+        visible_at = time.time() + self.visibility_timeout
+        with open(self.path, 'r') as fh:
+            fh.seek(self.read_offset)
+            while len(events) < max_events:
+                line = fh.readline()
+                if not line.endswith('\n'):
+                    break
+
+                start = self.read_offset
+                self.read_offset = fh.tell()
+                if not line.strip():
+                    continue
+
+                try:
+                    event = parse_event(line, start)
+                except InvalidEventError as error:
+                    logger.warning('Moving invalid event to {}: {}'.format(self.dead_letter_path, error))
+                    with open(self.dead_letter_path, 'a') as dead_letters:
+                        dead_letters.write(line)
+                    continue
+
+                self.in_flight[start] = [visible_at, event]
+                events.append(event)
+
+        self._save_offset()
+        return events
+
+    def ack(self, event):
+        if self.in_flight.pop(event.receipt, None):
+            self._save_offset()
+
+    def retry(self, event, delay):
+        if event.receipt in self.in_flight:
+            self.in_flight[event.receipt][0] = time.time() + delay
+
+    def publish(self, resource_type, resource_id):
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps({
+                'resource_type': resource_type,
+                'resource_id': resource_id,
+                'sent': time.time()
+            }) + '\n')
+
+    def _load_offset(self):
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path, 'r') as fh:
+                return int(fh.read().strip() or 0)
+
+        return 0
+
+    def _save_offset(self):
+        # Events are only skipped after a restart once they, and every event before them, have been acknowledged
+        offset = min(self.in_flight) if self.in_flight else self.read_offset
+        if offset != self.offset:
+            self.offset = offset
+            with open(self.offset_path, 'w') as fh:
+                fh.write(str(self.offset))
+
+
+class SQSEventQueue(BaseEventQueue):
+    """Event queue backed by an AWS SQS queue
+
+    Messages which are not valid events are moved to the dead letter queue if one is configured, or dropped otherwise,
+    so they are not delivered again
+    """
+
+    def __init__(self, queue_url, region_name=None, dead_letter_url=None):
+        self.queue_url = queue_url
+        self.dead_letter_url = dead_letter_url
+        self.client = boto3.client('sqs', region_name=region_name)
+
+    def receive(self, max_events=10, wait_time=0):
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_events, 10),
+            WaitTimeSeconds=wait_time,
+            AttributeNames=['SentTimestamp']
+        )
+
+        events = []
+        for message in response.get('Messages', []):
+            try:
+                # Milliseconds since the epoch
+                sent = message.get('Attributes', {}).get('SentTimestamp')
+                sent = int(sent) / 1000 if sent else None
+                events.append(parse_event(message['Body'], message['ReceiptHandle'], sent))
+            except InvalidEventError as error:
+                self.dead_letter(message, error)
+
+        return events
+
+    def dead_letter(self, message, error):
+        """Remove an invalid message from the queue, moving it to the dead letter queue if one is configured
+
+        Args:
+            message (`dict`): The SQS message
+            error (:obj:`InvalidEventError`): Reason the message is invalid
+
+        Returns:
+            `None`
+        """
+        logger.warning('Removing invalid event message {} from {}: {}'.format(
+            message.get('MessageId'),
+            self.queue_url,
+            error
+        ))
+        if self.dead_letter_url:
+            self.client.send_message(
+                QueueUrl=self.dead_letter_url,
+                MessageBody=message['Body'],
+                MessageAttributes={'error': {'DataType': 'String', 'StringValue': str(error)[:1024]}}
+            )
+
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message['ReceiptHandle'])
+
+    def ack(self, event):
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=event.receipt)
+
+    def retry(self, event, delay):
+        self.client.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=event.receipt,
+            VisibilityTimeout=min(int(delay), MAX_VISIBILITY_TIMEOUT)
+        )
+
+    def publish(self, resource_type, resource_id):
+        self.client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps({'resource_type': resource_type, 'resource_id': resource_id})
+        )
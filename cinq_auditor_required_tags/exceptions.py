@@ -11,3 +11,11 @@ class ResourceKillError(ResourceActionError):
 
 class ResourceStopError(ResourceActionError):
     pass
+
+
+class ResourceNotReadyError(InquisitorError):
+    """Raised when a resource can not be audited yet, because it has not been collected or is in its grace period"""
+
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
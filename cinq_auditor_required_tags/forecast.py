@@ -0,0 +1,201 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+import pytimeparse
+
+SECONDS_PER_DAY = 86400
+FORECAST_ACTIONS = ('alert', 'stop', 'remove')
+
+
+@lru_cache(maxsize=1024)
+def parse_schedule_value(value):
+    """Return the number of seconds represented by a schedule value
+
+    Schedule values are stored either as human readable strings (`3 weeks`) or, once a resource has been stopped or
+    removed, as the raw number of seconds, possibly converted to a string.
+
+    Args:
+        value (`str` or `int` or `None`): Schedule value to parse
+
+    Returns:
+        `int` or `None`
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    if value.lstrip('-').isdigit():
+        return int(value)
+
+    parsed = pytimeparse.parse(value)
+    return int(parsed) if parsed is not None else None
+
+
+def _action_day(created, threshold, now, horizon):
+    """Return the forecast day index at which each issue reaches `threshold` seconds of age
+
+    Thresholds already passed map to day 0, thresholds outside of the horizon map to `horizon`
+
+    Args:
+        created (:obj:`numpy.ndarray`): Issue creation times
+        threshold (`int` or `None`): Age, in seconds, at which the action triggers
+        now (`float`): Start of the forecast
+        horizon (`int`): Number of days to forecast
+
+    Returns:
+        :obj:`numpy.ndarray`
+    """
+    if threshold is None:
+        return np.full(created.shape, horizon, dtype=np.int64)
+
+    days = np.floor((created + threshold - now) / SECONDS_PER_DAY).astype(np.int64)
+    return np.clip(days, 0, horizon)
+
+
+def forecast_schedule(created, last_alert, account_idx, schedule, num_accounts, horizon, now=None):
+    """Project the actions a single alert schedule will trigger over the forecast horizon
+
+    Mirrors the precedence used by `RequiredTagsAuditor.determine_action`: removal wins over stopping, and both win
+    over alerts. Alerts are only counted for schedule entries newer than the last alert sent for the issue, and only
+    on days before the issue is stopped or removed. Stops are not counted for issues which have already been stopped.
+
+    Args:
+        created (:obj:`numpy.ndarray`): Issue creation times (epoch seconds)
+        last_alert (:obj:`numpy.ndarray`): Seconds value of the last alert sent for each issue
+        account_idx (:obj:`numpy.ndarray`): Index of the account owning each issue
+        schedule (`dict`): Alert schedule (`alert`, `stop` and `remove` keys) from `alert_settings`
+        num_accounts (`int`): Number of distinct accounts
+        horizon (`int`): Number of days to forecast
+        now (`float`): Start of the forecast, defaults to the current time
+
+    Returns:
+        :obj:`numpy.ndarray` of shape `(num_accounts, horizon, 3)` with alert, stop and remove counts
+    """
+    now = time.time() if now is None else now
+    counts = np.zeros((num_accounts, horizon, len(FORECAST_ACTIONS)), dtype=np.int64)
+    if not len(created):
+        return counts
+
+    remove_threshold = parse_schedule_value(schedule.get('remove'))
+    stop_threshold = parse_schedule_value(schedule.get('stop'))
+    remove_day = _action_day(created, remove_threshold, now, horizon)
+    stop_day = _action_day(created, stop_threshold, now, horizon)
+    enforce_day = np.minimum(stop_day, remove_day)
+
+    def _accumulate(action, days, mask):
+        mask = mask & (days < horizon)
+        np.add.at(counts, (account_idx[mask], days[mask], FORECAST_ACTIONS.index(action)), 1)
+
+    _accumulate('remove', remove_day, np.ones(created.shape, dtype=bool))
+    # Issues which have already been stopped have their `last_alert` set to the stop threshold
+    stopped = last_alert >= stop_threshold if stop_threshold is not None else np.zeros(created.shape, dtype=bool)
+    _accumulate('stop', stop_day, (stop_day < remove_day) & ~stopped)
+
+    alerts = {parse_schedule_value(alert) for alert in schedule.get('alert', [])}
+    for alert in sorted(alerts - {None}):
+        alert_day = _action_day(created, alert, now, horizon)
+        _accumulate('alert', alert_day, (last_alert < alert) & (alert_day < enforce_day))
+
+    return counts
+
+
+def forecast_enforcement(issues, alert_schedule, horizon=30, now=None):
+    """Forecast the number of alerts, stops and removals per day and per account
+
+    This function is free of side effects, it only evaluates the schedule against the provided issue data.
+
+    Args:
+        issues (`dict`): Column oriented issue data, with the keys `created`, `last_alert`, `account` and
+            `resource_type`, each holding a sequence with one entry per issue
+        alert_schedule (`dict`): The `alert_settings` configuration
+        horizon (`int`): Number of days to forecast
+        now (`float`): Start of the forecast, defaults to the current time
+
+    Returns:
+        `dict` mapping account names to a `dict` of action name to a `list` of per-day counts
+    """
+    now = time.time() if now is None else now
+
+    created = np.asarray(issues['created'], dtype=np.float64)
+
+    # Only a handful of distinct `last_alert` values exist, so parse each of them once
+    last_alert_lookup = {value: parse_schedule_value(value) for value in set(issues['last_alert'])}
+    last_alert = np.fromiter(
+        (-1 if last_alert_lookup[value] is None else last_alert_lookup[value] for value in issues['last_alert']),
+        dtype=np.float64,
+        count=len(created)
+    )
+    accounts, account_idx = np.unique(np.asarray(issues['account'], dtype=object).astype(str), return_inverse=True)
+    resource_types = np.asarray(issues['resource_type'], dtype=object).astype(str)
+
+    counts = np.zeros((len(accounts), horizon, len(FORECAST_ACTIONS)), dtype=np.int64)
+    default_mask = np.ones(created.shape, dtype=bool)
+    for resource_type, schedule in alert_schedule.items():
+        if resource_type == '*':
+            continue
+
+        mask = resource_types == resource_type
+        default_mask &= ~mask
+        counts += forecast_schedule(
+            created[mask], last_alert[mask], account_idx[mask], schedule, len(accounts), horizon, now
+        )
+
+    if '*' in alert_schedule:
+        counts += forecast_schedule(
+            created[default_mask],
+            last_alert[default_mask],
+            account_idx[default_mask],
+            alert_schedule['*'],
+            len(accounts),
+            horizon,
+            now
+        )
+
+    return {
+        account: {
+            action: counts[idx, :, action_idx].tolist()
+            for action_idx, action in enumerate(FORECAST_ACTIONS)
+        } for idx, account in enumerate(accounts)
+    }
+
+
+def next_deadlines(issues, alert_schedule):
+    """Return the time of the next alert, stop or removal for each issue
+
+    Thresholds at or below the last alert sent for an issue have already been acted on and are ignored
+
+    Args:
+        issues (`dict`): Column oriented issue data, as used by `forecast_enforcement`
+        alert_schedule (`dict`): The `alert_settings` configuration
+
+    Returns:
+        :obj:`numpy.ndarray` of epoch times, `inf` for issues without any upcoming action
+    """
+    created = np.asarray(issues['created'], dtype=np.float64)
+    last_alert_lookup = {value: parse_schedule_value(value) for value in set(issues['last_alert'])}
+    last_alert = np.fromiter(
+        (-1 if last_alert_lookup[value] is None else last_alert_lookup[value] for value in issues['last_alert']),
+        dtype=np.float64,
+        count=len(created)
+    )
+    resource_types = np.asarray(issues['resource_type'], dtype=object).astype(str)
+
+    deadlines = np.full(created.shape, np.inf)
+    default_mask = np.ones(created.shape, dtype=bool)
+    for resource_type, schedule in sorted(alert_schedule.items(), key=lambda item: item[0] == '*'):
+        if resource_type == '*':
+            mask = default_mask
+        else:
+            mask = resource_types == resource_type
+            default_mask &= ~mask
+
+        thresholds = {parse_schedule_value(alert) for alert in schedule.get('alert', [])}
+        thresholds |= {parse_schedule_value(schedule.get('stop')), parse_schedule_value(schedule.get('remove'))}
+        for threshold in thresholds - {None}:
+            pending = mask & (last_alert < threshold)
+            deadlines[pending] = np.minimum(deadlines[pending], created[pending] + threshold)
+
+    return deadlines
@@ -0,0 +1,397 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from cinq_auditor_required_tags.schema import JournalRecord
+from cloud_inquisitor.database import db
+from cloud_inquisitor.schema import AuditLog
+from cloud_inquisitor.schema.enforcements import Enforcements
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+JOURNAL_PREFIX = 'cinq_required_tags_journal.'
+JOURNAL_SUFFIX = '.jsonl'
+
+# Pending records must survive a reboot, so the journal is not kept in the temporary directory, which is often tmpfs
+DEFAULT_JOURNAL_DIR = '/var/lib/cinq/required_tags_journal'
+
+# Audit log events are also emitted to the same logger as `cloud_inquisitor.log.auditlog`, which feeds the syslog trail
+audit_logger = logging.getLogger('audit-log')
+
+# Number of seconds the IDs of written records are kept for, journal files are replayed well before that
+RECORD_RETENTION = 7 * 86400
+
+# Maximum number of seconds to wait before retrying a failed flush
+MAX_RETRY_DELAY = 300
+
+
+class EnforcementJournal(object):
+    """Buffers enforcement records and audit log events, writing them to the database in bulk
+
+    Every record is appended to a journal file owned by the current process, which holds an exclusive lock on it. The
+    records are written to the database when `max_records` are pending or the oldest pending record is older than
+    `max_age` seconds, after which the journal file is truncated. Pending records are only kept in the journal file,
+    not in memory.
+
+    Each record has a unique ID which is written to the database in the same transaction as the record, so records
+    written before a crash are skipped when their journal file is replayed. Journal files left by crashed processes
+    are picked up by `replay` in any process using the same journal directory
+    """
+
+    def __init__(self, directory=None, max_records=500, max_age=30, worker_id=None):
+        self.directory = directory or DEFAULT_JOURNAL_DIR
+        self.max_records = max_records
+        self.max_age = max_age
+        self.worker_id = worker_id
+        self.fh = None
+        self.fh_pid = None
+        self.pending = 0
+        self.oldest = None
+        self.failures = 0
+        self.retry_after = None
+        self.session_factory = None
+
+    @property
+    def path(self):
+        """Path of the journal file of this process
+
+        Returns:
+            `str`
+        """
+        worker_id = self.worker_id or '{}.{}'.format(socket.gethostname(), os.getpid())
+        return os.path.join(self.directory, '{}{}{}'.format(JOURNAL_PREFIX, worker_id, JOURNAL_SUFFIX))
+
+    def configure(self, directory=None, max_records=None, max_age=None):
+        """Update the journal settings, creating the journal directory if needed. Any pending records are flushed first
+
+        Args:
+            directory (`str`): Directory of the journal files
+            max_records (`int`): Number of records to buffer before flushing
+            max_age (`int`): Number of seconds to buffer a record before flushing
+
+        Returns:
+            `None`
+
+        Raises:
+            `OSError` if the journal directory can not be created
+        """
+        self.max_records = max_records or self.max_records
+        self.max_age = max_age or self.max_age
+
+        directory = directory or self.directory
+        if directory != self.directory:
+            self.close()
+            if self.pending:
+                logger.warning('Keeping the journal directory {}, {} records could not be written'.format(
+                    self.directory,
+                    self.pending
+                ))
+            else:
+                self.directory = directory
+
+        # Fail when the auditor starts, rather than when the first enforcement is recorded
+        os.makedirs(self.directory, exist_ok=True)
+
+    def record_enforcement(self, account_id, resource_id, action, timestamp, metrics):
+        """Record an enforcement. Takes the same arguments as `Enforcement.create`
+
+        Args:
+            account_id (`int`): ID of the account of the resource
+            resource_id (`str`): ID of the resource
+            action (`str`): Enforcement action taken
+            timestamp (:obj:`datetime`): Time of the enforcement
+            metrics (`dict`): Metrics of the resource at the time of the enforcement
+
+        Returns:
+            `None`
+        """
+        self._append({
+            'type': 'enforcement',
+            'account_id': account_id,
+            'resource_id': resource_id,
+            'action': action,
+            'timestamp': timestamp.strftime(TIMESTAMP_FORMAT),
+            'metrics': metrics
+        })
+
+    def record_auditlog(self, event, actor, data, level=logging.INFO):
+        """Record an audit log event, and emit it to the audit log logger. Takes the same arguments as `auditlog`
+
+        Args:
+            event (`str`): Name of the event
+            actor (`str`): Actor triggering the event
+            data (`dict`): Event data
+            level (`str` or `int`): Log level of the event
+
+        Returns:
+            `None`
+        """
+        self._append({
+            'type': 'auditlog',
+            'event': event,
+            'actor': actor,
+            'data': data,
+            'timestamp': datetime.now().strftime(TIMESTAMP_FORMAT)
+        })
+        audit_logger.log(
+            logging.getLevelName(level) if isinstance(level, str) else level,
+            {'event': event, 'actor': actor, 'data': data}
+        )
+
+    def flush_if_due(self, force=False):
+        """Flush the pending records if they have reached the size or age threshold, or always if `force` is set.
+        Never raises, records which could not be written stay in the journal file and the flush is retried with an
+        exponential backoff
+
+        Args:
+            force (`bool`): Flush regardless of the thresholds and any backoff
+
+        Returns:
+            `int` - Number of records written
+        """
+        if not self.pending:
+            return 0
+
+        now = time.time()
+        if not force:
+            if self.retry_after and now < self.retry_after:
+                return 0
+
+            if self.pending < self.max_records and now - self.oldest < self.max_age:
+                return 0
+
+        try:
+            count = self.flush()
+        except Exception:
+            self.failures += 1
+            delay = min(self.max_age * 2 ** (self.failures - 1), MAX_RETRY_DELAY)
+            self.retry_after = now + delay
+            logger.exception('Failed to flush {} enforcement journal records, retrying in {} seconds'.format(
+                self.pending,
+                delay
+            ))
+            return 0
+
+        self.failures = 0
+        self.retry_after = None
+        return count
+
+    def flush(self):
+        """Write all pending records to the database and truncate the journal file
+
+        Returns:
+            `int` - Number of records written
+        """
+        if not self.pending:
+            return 0
+
+        fh = self._open()
+        count = self._write_file(fh)
+        fh.seek(0)
+        fh.truncate()
+        self.pending = 0
+        self.oldest = None
+
+        return count
+
+    def replay(self):
+        """Write the pending records of this process, and the records left in the journal files of crashed processes,
+        to the database. Never raises, files which can not be replayed are retried on the next call
+
+        Journal files are locked by the process owning them, so only files whose owner is gone are replayed
+
+        Returns:
+            `int` - Number of records replayed
+        """
+        count = self.flush_if_due(force=True)
+        own_path = self.path
+        for path in glob.glob(os.path.join(self.directory, '{}*{}'.format(JOURNAL_PREFIX, JOURNAL_SUFFIX))):
+            if path == own_path:
+                continue
+
+            try:
+                with open(path, 'r') as fh:
+                    try:
+                        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # Owned by a live process
+                        continue
+
+                    # Another process may have replayed and removed the file while we were opening it
+                    if not os.path.exists(path) or os.stat(path).st_ino != os.fstat(fh.fileno()).st_ino:
+                        continue
+
+                    logger.info('Replaying enforcement journal {}'.format(path))
+                    count += self._write_file(fh)
+                    os.unlink(path)
+            except FileNotFoundError:
+                continue
+            except Exception:
+                logger.exception('Failed to replay enforcement journal {}'.format(path))
+
+        try:
+            session = self._get_session()
+            try:
+                session.query(JournalRecord).filter(
+                    JournalRecord.written < datetime.utcnow() - timedelta(seconds=RECORD_RETENTION)
+                ).delete(synchronize_session=False)
+                session.commit()
+            finally:
+                session.close()
+        except Exception:
+            logger.exception('Failed to prune the written enforcement journal records')
+
+        return count
+
+    def close(self):
+        """Flush any pending records and close the journal file, releasing its lock
+
+        Returns:
+            `None`
+        """
+        self.flush_if_due(force=True)
+        if self.fh and self.fh_pid == os.getpid():
+            self.fh.close()
+
+        self.fh = None
+        self.fh_pid = None
+
+    def _append(self, record):
+        record['record_id'] = uuid.uuid4().hex
+
+        fh = self._open()
+        fh.write(json.dumps(record, default=str) + '\n')
+        fh.flush()
+        os.fsync(fh.fileno())
+
+        self.pending += 1
+        self.oldest = self.oldest or time.time()
+        self.flush_if_due()
+
+    def _open(self):
+        """Returns the journal file of this process, opening and locking it if needed
+
+        Returns:
+            file object
+        """
+        pid = os.getpid()
+        if self.fh and self.fh_pid == pid:
+            return self.fh
+
+        if self.fh:
+            # Inherited from the parent process, which still owns the file and its pending records
+            self.fh.close()
+            self.pending = 0
+            self.oldest = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path
+        while True:
+            fh = open(path, 'a+')
+            # Blocks while another process replays a file left by a crashed process with the same ID
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            if os.path.exists(path) and os.stat(path).st_ino == os.fstat(fh.fileno()).st_ino:
+                break
+
+            fh.close()
+
+        self.fh = fh
+        self.fh_pid = pid
+
+        # Records left by a crashed process with the same ID are written with the records of this process
+        fh.seek(0)
+        self.pending = sum(1 for line in fh if line.endswith('\n'))
+        self.oldest = time.time() if self.pending else None
+
+        return fh
+
+    def _write_file(self, fh):
+        """Write the records of a journal file to the database, `max_records` at a time
+
+        Args:
+            fh: Open journal file
+
+        Returns:
+            `int` - Number of records read
+        """
+        count = 0
+        records = []
+        fh.seek(0)
+        for line in fh:
+            # A line without a newline was being written when the process crashed, and was never acted on
+            if not line.endswith('\n'):
+                break
+
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.error('Skipping invalid enforcement journal record in {}: {!r}'.format(fh.name, line))
+                continue
+
+            if len(records) >= self.max_records:
+                self._write(records)
+                count += len(records)
+                records = []
+
+        if records:
+            self._write(records)
+            count += len(records)
+
+        return count
+
+    def _get_session(self):
+        # Use a separate session, so flushing never commits the auditor's in-progress transaction
+        if not self.session_factory:
+            self.session_factory = sessionmaker(bind=db.session.get_bind())
+
+        return self.session_factory()
+
+    def _write(self, records):
+        session = self._get_session()
+        try:
+            # Skip records written before the journal file could be truncated
+            written = {
+                record_id for record_id, in session.query(JournalRecord.record_id).filter(
+                    JournalRecord.record_id.in_([record['record_id'] for record in records])
+                )
+            }
+            records = [record for record in records if record['record_id'] not in written]
+
+            session.bulk_insert_mappings(Enforcements, [
+                {
+                    'account_id': record['account_id'],
+                    'resource_id': record['resource_id'],
+                    'action': record['action'],
+                    'timestamp': datetime.strptime(record['timestamp'], TIMESTAMP_FORMAT),
+                    'metrics': record['metrics']
+                } for record in records if record['type'] == 'enforcement'
+            ])
+            session.bulk_insert_mappings(AuditLog, [
+                {
+                    'event': record['event'],
+                    'actor': record['actor'],
+                    'data': record['data'],
+                    'timestamp': datetime.strptime(record['timestamp'], TIMESTAMP_FORMAT)
+                } for record in records if record['type'] == 'auditlog'
+            ])
+            session.bulk_insert_mappings(JournalRecord, [
+                {'record_id': record['record_id'], 'written': datetime.utcnow()} for record in records
+            ])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+enforcement_journal = EnforcementJournal()
@@ -0,0 +1,105 @@
+from collections import defaultdict, namedtuple
+from itertools import product
+
+WILDCARD = '*'
+
+TagPolicy = namedtuple('TagPolicy', ('name', 'resource_types', 'accounts', 'regions', 'required_tags'))
+
+
+def parse_policy(data, idx=0):
+    """Build a policy from its configuration
+
+    Args:
+        data (`dict`): Policy configuration, with the `required_tags` key and the optional `name`, `resource_types`,
+        `accounts` and `regions` keys. Missing selectors match everything
+        idx (`int`): Position of the policy in the configuration, used as its name if not provided
+
+    Returns:
+        :obj:`TagPolicy`
+    """
+    def _values(key):
+        values = data.get(key) or [WILDCARD]
+        return tuple(values) if isinstance(values, (list, tuple)) else (values,)
+
+    return TagPolicy(
+        name=data.get('name', 'policy-{}'.format(idx)),
+        resource_types=_values('resource_types'),
+        accounts=_values('accounts'),
+        regions=_values('regions'),
+        required_tags=tuple(tag.lower() for tag in data['required_tags'])
+    )
+
+
+class PolicyIndex(object):
+    """Index of required tag policies by resource type, account and region
+
+    Every policy is stored under each `(resource type, account, region)` combination it selects, with `*` for
+    selectors matching everything. Looking up the policies for a resource checks the eight combinations of its own
+    values and wildcards, so the cost per resource does not depend on the number of policies. The required tags of
+    all matching policies are merged and cached per combination
+    """
+
+    def __init__(self, policies):
+        self.policies = list(policies)
+        self.index = defaultdict(list)
+        self.cache = {}
+        self.positions = {id(policy): idx for idx, policy in enumerate(self.policies)}
+
+        for policy in self.policies:
+            for key in product(policy.resource_types, policy.accounts, policy.regions):
+                self.index[key].append(policy)
+
+    @classmethod
+    def from_config(cls, policies, default_tags):
+        """Build the index from the policy configuration, falling back to a single global policy
+
+        Args:
+            policies (`list` of `dict`): Policy configurations
+            default_tags (`list` of `str`): Tags required from all resources if no policies are configured
+
+        Returns:
+            :obj:`PolicyIndex`
+        """
+        if not policies:
+            policies = [{'name': 'default', 'required_tags': default_tags}]
+
+        return cls(parse_policy(policy, idx) for idx, policy in enumerate(policies))
+
+    def get_policies(self, resource_type, account, region):
+        """Returns the policies applying to a resource
+
+        Args:
+            resource_type (`str`): Type of the resource
+            account (`str`): Name of the account of the resource
+            region (`str`): Region of the resource
+
+        Returns:
+            `list` of :obj:`TagPolicy`, in configuration order
+        """
+        policies = {}
+        for key in product((resource_type, WILDCARD), (account, WILDCARD), (region, WILDCARD)):
+            for policy in self.index.get(key, ()):
+                policies[id(policy)] = policy
+
+        return [policies[key] for key in sorted(policies, key=self.positions.get)]
+
+    def get_required_tags(self, resource_type, account, region):
+        """Returns the tags required from a resource by all policies applying to it
+
+        Args:
+            resource_type (`str`): Type of the resource
+            account (`str`): Name of the account of the resource
+            region (`str`): Region of the resource
+
+        Returns:
+            `tuple` of `str`
+        """
+        key = (resource_type, account, region)
+        if key not in self.cache:
+            required_tags = []
+            for policy in self.get_policies(resource_type, account, region):
+                required_tags += [tag for tag in policy.required_tags if tag not in required_tags]
+
+            self.cache[key] = tuple(required_tags)
+
+        return self.cache[key]
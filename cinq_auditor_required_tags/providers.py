@@ -1,5 +1,6 @@
 import logging
 import json
+from collections import defaultdict
 
 from botocore.exceptions import ClientError
 from datetime import datetime, timedelta
@@ -7,40 +8,150 @@ from datetime import datetime, timedelta
 from cloud_inquisitor.config import dbconfig
 from cloud_inquisitor.plugins.types.accounts import AWSAccount
 
+from cinq_auditor_required_tags.apicalls import api_calls
 from cinq_auditor_required_tags.exceptions import ResourceKillError, ResourceStopError, ResourceActionError
+from cinq_auditor_required_tags.journal import enforcement_journal
 from cloud_inquisitor import get_aws_session
 from cloud_inquisitor.constants import NS_AUDITOR_REQUIRED_TAGS
-from cloud_inquisitor.log import auditlog
 from cloud_inquisitor.plugins.types.resources import EC2Instance
-from cloud_inquisitor.plugins.types.enforcements import Enforcement
 
 logger = logging.getLogger(__name__)
 
+# Live state of resources which no longer exist
+STATE_NOT_FOUND = 'not_found'
 
-def process_action(resource, action, resource_type):
+# Maximum number of values allowed in a single DescribeInstances filter
+DESCRIBE_FILTER_LIMIT = 200
+
+
+def process_action(resource, action, resource_type, **kwargs):
     """Process an audit action for a resource, if possible
 
     Args:
         resource (:obj:`Resource`): A resource object to perform the action on
         action (`str`): Type of action to perform (`kill` or `stop`)
         resource_type (`str`): Type of the resource
+        **kwargs: Extra arguments for the action function, such as the prefetched live `state` of the resource
 
     Returns:
         `bool` - Returns the result from the action function
     """
     func_action = action_mapper[resource_type][action]
     if func_action:
-        session = get_aws_session(AWSAccount(resource.account))
-        client = session.client(
-            action_mapper[resource_type]['service_name'],
-            region_name=resource.location
-        )
-        return func_action(client, resource)
+        with api_calls.track('{}.{}'.format(resource_type, action)):
+            session = get_session(resource.account)
+            client = session.client(
+                action_mapper[resource_type]['service_name'],
+                region_name=resource.location
+            )
+            return func_action(client, resource, **kwargs)
 
     return False
 
 
-def stop_ec2_instance(client, resource):
+def get_session(account):
+    """Returns a boto3 session for the account, with API call accounting enabled
+
+    Args:
+        account (:obj:`Account`): The account to get a session for
+
+    Returns:
+        :obj:`boto3.session.Session`
+    """
+    session = get_aws_session(AWSAccount(account))
+    api_calls.register(session)
+    return session
+
+
+def get_live_states(resources, resource_type):
+    """Fetch the current state of a list of resources from AWS, if supported for the resource type
+
+    Args:
+        resources (`list` of :obj:`Resource`): Resources to fetch the state for
+        resource_type (`str`): Type of the resources
+
+    Returns:
+        `dict` mapping resource IDs to their current state, or `STATE_NOT_FOUND`. Resources for which the state could
+        not be determined are left out
+    """
+    func_describe = action_mapper[resource_type].get('describe')
+    if func_describe and resources:
+        with api_calls.track('{}.describe'.format(resource_type), len(resources)):
+            return func_describe(resources)
+
+    return {}
+
+
+def get_property_index(resource):
+    """Returns the properties of a resource as a dictionary
+
+    Args:
+        resource (:obj:`Resource`): The resource
+
+    Returns:
+        `dict`
+    """
+    return {prop.name: prop.value for prop in resource.properties}
+
+
+def get_ec2_instance_metrics(resource):
+    """Returns the metrics recorded for enforcements on an EC2 Instance
+
+    Args:
+        resource (:obj:`Resource`): The instance
+
+    Returns:
+        `dict`
+    """
+    properties = get_property_index(resource)
+    return {
+        'instance_type': properties.get('instance_type', 'Not Found'),
+        'public_ip': properties.get('public_ip', 'Not Found')
+    }
+
+
+def describe_ec2_instances(resources):
+    """Fetch the live state of EC2 Instances, with one paginated DescribeInstances call per account and region
+
+    Args:
+        resources (`list` of :obj:`Resource`): Instances to fetch the state for
+
+    Returns:
+        `dict` mapping instance IDs to the instance state name, or `STATE_NOT_FOUND`
+    """
+    groups = defaultdict(list)
+    for resource in resources:
+        groups[(resource.account_id, resource.location)].append(resource)
+
+    states = {}
+    for (account_id, location), group in groups.items():
+        try:
+            session = get_session(group[0].account)
+            paginator = session.client('ec2', region_name=location).get_paginator('describe_instances')
+            instance_ids = [resource.resource_id for resource in group]
+
+            # Filtering instead of passing InstanceIds means missing instances are left out rather than failing the call
+            for idx in range(0, len(instance_ids), DESCRIBE_FILTER_LIMIT):
+                batch = instance_ids[idx:idx + DESCRIBE_FILTER_LIMIT]
+                found = {}
+                for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': batch}]):
+                    for reservation in page['Reservations']:
+                        for instance in reservation['Instances']:
+                            found[instance['InstanceId']] = instance['State']['Name']
+
+                states.update({instance_id: found.get(instance_id, STATE_NOT_FOUND) for instance_id in batch})
+
+        except Exception as error:
+            logger.warning('Failed to fetch live instance states for {}/{}: {}'.format(
+                group[0].account.account_name,
+                location,
+                error
+            ))
+
+    return states
+
+
+def stop_ec2_instance(client, resource, state=None):
     """Stop an EC2 Instance
 
     This function will attempt to stop a running instance. If the instance is already stopped the function will return
@@ -49,28 +160,23 @@ def stop_ec2_instance(client, resource):
     Args:
         client (:obj:`boto3.session.Session.client`): A boto3 client object
         resource (:obj:`Resource`): The resource object to stop
+        state (`str`): Live state of the instance, if already known. Falls back to the cached state if not provided
 
     Returns:
         `bool`
     """
     try:
-        instance = EC2Instance.get(resource.resource_id)
-        if instance.state not in ('stopped', 'terminated'):
-            instance_type = "Not Found"
-            public_ip = "Not Found"
-            for prop in resource.properties:
-                if prop.name == "instance_type":
-                    instance_type = prop.value
-                if prop.name == "public_ip":
-                    public_ip = prop.value
-
-            metrics = {"instance_type": instance_type, "public_ip": public_ip}
+        if state is None:
+            state = EC2Instance.get(resource.resource_id).state
+
+        if state not in ('stopping', 'stopped', 'shutting-down', 'terminated', STATE_NOT_FOUND):
+            metrics = get_ec2_instance_metrics(resource)
 
             client.stop_instances(InstanceIds=[resource.resource_id])
             logger.debug('Stopped instance {}/{}'.format(resource.account.account_name, resource.resource_id))
-            Enforcement.create(resource.account_id, resource.resource_id, 'STOP',
-                               datetime.now(), metrics)
-            auditlog(
+            enforcement_journal.record_enforcement(resource.account_id, resource.resource_id, 'STOP',
+                                                   datetime.now(), metrics)
+            enforcement_journal.record_auditlog(
                 event='required_tags.ec2.stop',
                 actor=NS_AUDITOR_REQUIRED_TAGS,
                 data={
@@ -96,7 +202,7 @@ def stop_ec2_instance(client, resource):
         ))
 
 
-def terminate_ec2_instance(client, resource):
+def terminate_ec2_instance(client, resource, state=None):
     """Terminate an EC2 Instance
 
     This function will terminate an EC2 Instance. Returns `True` if succesful, or raises an exception if not
@@ -104,22 +210,18 @@ def terminate_ec2_instance(client, resource):
     Args:
         client (:obj:`boto3.session.Session.client`): A boto3 client object
         resource (:obj:`Resource`): The resource object to terminate
+        state (`str`): Live state of the instance, if already known
 
     Returns:
         `bool` - True if the instance was terminated. Will raise an exception if failed
     """
     # TODO: Implement disabling of TerminationProtection
+    if state in ('shutting-down', 'terminated', STATE_NOT_FOUND):
+        return False
+
     try:
         # Gather instance metrics before termination
-        instance_type = "Not Found"
-        public_ip = "Not Found"
-        for prop in resource.properties:
-            if prop.name == "instance_type":
-                instance_type = prop.value
-            if prop.name == "public_ip":
-                public_ip = prop.value
-
-        metrics = {"instance_type": instance_type, "public_ip": public_ip}
+        metrics = get_ec2_instance_metrics(resource)
 
         client.terminate_instances(InstanceIds=[resource.resource_id])
         logger.info('Terminated instance {}/{}/{}'.format(
@@ -127,9 +229,9 @@ def terminate_ec2_instance(client, resource):
             resource.location,
             resource.resource_id
         ))
-        Enforcement.create(resource.account_id, resource.resource_id, 'TERMINATE',
-                           datetime.now(), metrics)
-        auditlog(
+        enforcement_journal.record_enforcement(resource.account_id, resource.resource_id, 'TERMINATE',
+                                               datetime.now(), metrics)
+        enforcement_journal.record_auditlog(
             event='required_tags.ec2.terminate',
             actor=NS_AUDITOR_REQUIRED_TAGS,
             data={
@@ -157,7 +259,7 @@ def terminate_ec2_instance(client, resource):
 
 def delete_s3_bucket(client, resource):
     try:
-        session = get_aws_session(AWSAccount(resource.account))
+        session = get_session(resource.account)
         bucket = session.resource('s3', resource.location).Bucket(resource.resource_id)
         days_until_expiry = dbconfig.get('lifecycle_expiration_days', NS_AUDITOR_REQUIRED_TAGS, 3)
         # Separate rule for Object Markers is needed and can't be combined into a single rule per AWS API
@@ -196,19 +298,16 @@ def delete_s3_bucket(client, resource):
             ]
         }
 
-        metrics = {'Unavailable': 'Unavailable'}
-        for prop in resource.properties:
-            if prop.name == "metrics":
-                metrics = prop.value
+        metrics = get_property_index(resource).get('metrics', {'Unavailable': 'Unavailable'})
 
         objects = list(bucket.objects.limit(count=1))
         versions = list(bucket.object_versions.limit(count=1))
         if not objects and not versions:
             bucket.delete()
             logger.info('Deleted s3 bucket {} in {}'.format(resource.resource_id, resource.account))
-            Enforcement.create(resource.account_id, resource.resource_id, 'DELETED',
-                               datetime.now(), metrics)
-            auditlog(
+            enforcement_journal.record_enforcement(resource.account_id, resource.resource_id, 'DELETED',
+                                                   datetime.now(), metrics)
+            enforcement_journal.record_auditlog(
                 event='required_tags.s3.terminate',
                 actor=NS_AUDITOR_REQUIRED_TAGS,
                 data={
@@ -246,8 +345,9 @@ def delete_s3_bucket(client, resource):
                         resource.resource_id,
                         resource.account
                     ))
-                    Enforcement.create(resource.account_id, resource.resource_id, 'LIFECYCLE_APPLIED',
-                                       datetime.now(), metrics)
+                    enforcement_journal.record_enforcement(
+                        resource.account_id, resource.resource_id, 'LIFECYCLE_APPLIED', datetime.now(), metrics
+                    )
 
                 if 'cinqDenyObjectUploads' not in current_bucket_policy:
                     bucket.Policy().put(Policy=json.dumps(bucket_policy))
@@ -279,11 +379,13 @@ def delete_s3_bucket(client, resource):
 action_mapper = {
     'aws_ec2_instance': {
         'service_name': 'ec2',
+        'describe': describe_ec2_instances,
         'stop': stop_ec2_instance,
         'kill': terminate_ec2_instance
     },
     'aws_s3_bucket': {
         'service_name': 's3',
+        'describe': None,
         'stop': None,
         'kill': delete_s3_bucket
     }
@@ -0,0 +1,130 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, JSON, String
+
+from cloud_inquisitor.database import Model, db
+
+
+class ShardLease(Model):
+    """Lease on a partition of the issue ID hash space, held by a single auditor worker"""
+    __tablename__ = 'required_tags_shard_leases'
+
+    shard_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(256), nullable=True)
+    expires = Column(DateTime, nullable=True, index=True)
+    fence = Column(Integer, nullable=False, default=0)
+
+
+class ShardWorker(Model):
+    """Registration of a live auditor worker, used to divide the shards fairly between the workers"""
+    __tablename__ = 'required_tags_shard_workers'
+
+    worker_id = Column(String(256), primary_key=True)
+    expires = Column(DateTime, nullable=False, index=True)
+
+
+class IssueSnapshot(Model):
+    """Denormalized copy of a required tags issue and its properties, one row per issue"""
+    __tablename__ = 'required_tags_issue_snapshots'
+
+    issue_id = Column(String(256), primary_key=True)
+    resource_id = Column(String(256), nullable=False, index=True)
+    account_id = Column(Integer, nullable=True, index=True)
+    location = Column(String(50), nullable=True, index=True)
+    resource_type = Column(String(100), nullable=True)
+    state = Column(String(50), nullable=True, index=True)
+    created = Column(Float, nullable=True, index=True)
+    last_alert = Column(String(50), nullable=True)
+    last_change = Column(DateTime, nullable=False, index=True)
+    missing_tags = Column(JSON, nullable=True)
+    notes = Column(JSON, nullable=True)
+
+    def to_json(self, issue_type_id=None, resource=None):
+        """Returns the snapshot in the same format as the issue it was taken from
+
+        Args:
+            issue_type_id (`int`): ID of the required tags issue type
+            resource (`dict`): JSON representation of the resource the issue is for
+
+        Returns:
+            `dict`
+        """
+        return {
+            'issueType': issue_type_id,
+            'issueId': self.issue_id,
+            'properties': {
+                'resourceId': self.resource_id,
+                'accountId': self.account_id,
+                'location': self.location,
+                'resourceType': self.resource_type,
+                'state': self.state,
+                'created': self.created,
+                'lastAlert': self.last_alert,
+                'lastChange': self.last_change,
+                'missingTags': self.missing_tags,
+                'notes': self.notes
+            },
+            'resource': resource
+        }
+
+
+class IssueTombstone(Model):
+    """Record of a fixed required tags issue, kept so delta exports can report the removal"""
+    __tablename__ = 'required_tags_issue_tombstones'
+
+    issue_id = Column(String(256), primary_key=True)
+    resource_id = Column(String(256), nullable=False)
+    account_id = Column(Integer, nullable=True)
+    location = Column(String(50), nullable=True)
+    resource_type = Column(String(100), nullable=True)
+    fixed = Column(DateTime, nullable=False, index=True)
+
+
+class AuditRun(Model):
+    """A single run of the auditor. The generation increases with every run. Finished runs also hold the adaptive
+    schedule of the worker, as UNIX timestamps"""
+    __tablename__ = 'required_tags_audit_runs'
+
+    generation = Column(Integer, primary_key=True, autoincrement=True)
+    worker_key = Column(String(256), nullable=False, index=True)
+    config_version = Column(String(40), nullable=False)
+    base_generation = Column(Integer, nullable=True)
+    phase = Column(String(20), nullable=False, index=True)
+    started = Column(DateTime, nullable=False)
+    updated = Column(DateTime, nullable=False)
+    scan = Column(JSON, nullable=True)
+    next_full_run = Column(Float, nullable=True)
+    next_deadline = Column(Float, nullable=True)
+
+
+class AuditRunAction(Model):
+    """An action decided during an auditor run, and whether it has been completed"""
+    __tablename__ = 'required_tags_audit_run_actions'
+
+    generation = Column(Integer, primary_key=True, autoincrement=False)
+    issue_id = Column(String(256), primary_key=True)
+    action = Column(String(50), nullable=False)
+    action_description = Column(String(256), nullable=True)
+    last_alert = Column(String(50), nullable=True)
+    completed = Column(Boolean, nullable=False, default=False)
+    notice = Column(JSON, nullable=True)
+
+
+class JournalRecord(Model):
+    """ID of an enforcement journal record which has been written to the database, used to skip records which are
+    replayed again after a crash"""
+    __tablename__ = 'required_tags_journal_records'
+
+    record_id = Column(String(32), primary_key=True)
+    written = Column(DateTime, nullable=False, index=True)
+
+
+def create_tables():
+    """Create the tables used by the auditor, if they do not already exist
+
+    Returns:
+        `None`
+    """
+    bind = db.session.get_bind()
+    for model in (
+        ShardLease, ShardWorker, IssueSnapshot, IssueTombstone, AuditRun, AuditRunAction, JournalRecord
+    ):
+        model.__table__.create(bind, checkfirst=True)
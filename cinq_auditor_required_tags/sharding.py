@@ -0,0 +1,380 @@
+import atexit
+import logging
+import math
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from cinq_auditor_required_tags.schema import ShardLease, ShardWorker
+from cloud_inquisitor.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def get_shard(key, shard_count):
+    """Return the shard a key belongs to
+
+    Uses CRC32 instead of `hash()` as the shard must be stable across processes and hosts
+
+    Args:
+        key (`str`): Key to look up, usually an issue ID
+        shard_count (`int`): Total number of shards
+
+    Returns:
+        `int`
+    """
+    return zlib.crc32(key.encode('utf-8')) % shard_count
+
+
+class ShardCoordinator(object):
+    """Coordinates ownership of issue ID shards between auditor workers using leases stored in the database
+
+    Each lease carries a fencing token which is incremented every time the lease changes owner. A worker verifies it
+    still holds the lease, with the same fencing token, before enforcing an issue, so an issue is never enforced by a
+    worker whose lease has been taken over
+
+    Every worker registers itself when it claims shards, and claims at most its fair share of the shards between all
+    live workers, releasing any shards above that share. Leases still held by the worker ID in the database, for example
+    by an earlier run in the same process, are adopted. Leases and the registration are renewed by a background thread
+    while a run is in progress, between `start` and `stop`. Use `get_coordinator` to share a single coordinator per
+    process
+    """
+
+    def __init__(self, shard_count, lease_ttl, worker_id=None):
+        self.shard_count = shard_count
+        self.lease_ttl = timedelta(seconds=lease_ttl)
+        self.worker_id = worker_id or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.leases = {}
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.heartbeat_thread = None
+        self.exit_handler = False
+        self.pid = os.getpid()
+
+    @property
+    def shards(self):
+        with self.lock:
+            return set(self.leases)
+
+    def start(self):
+        """Start renewing the leases in the background, every third of the lease TTL, until `stop` is called. The
+        leases are released when the process exits
+
+        Returns:
+            `None`
+        """
+        if self.heartbeat_thread:
+            return
+
+        self.stopped.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop,
+            name='shard-heartbeat-{}'.format(self.worker_id),
+            daemon=True
+        )
+        self.heartbeat_thread.start()
+        if not self.exit_handler:
+            atexit.register(self.shutdown)
+            self.exit_handler = True
+
+    def stop(self):
+        """Stop the background heartbeat. The leases are kept, so the next run adopts them unless they expire first
+
+        Returns:
+            `None`
+        """
+        self.stopped.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=10)
+            self.heartbeat_thread = None
+
+    def shutdown(self):
+        """Stop the background heartbeat and release all leases held by this worker
+
+        Returns:
+            `None`
+        """
+        # Exit handlers are inherited by forked processes, which must not release the leases of their parent
+        if os.getpid() != self.pid:
+            return
+
+        self.stop()
+        self.release()
+
+    def owns(self, key):
+        """Returns `True` if the key belongs to a shard currently leased by this worker
+
+        Args:
+            key (`str`): Key to check, usually an issue ID
+
+        Returns:
+            `bool`
+        """
+        return get_shard(key, self.shard_count) in self.leases
+
+    def claim(self):
+        """Renew the leases held by this worker, release any shards above this worker's fair share and claim free or
+        expired shards up to it
+
+        Returns:
+            `set` of `int` - The shards owned by this worker
+        """
+        self._create_leases()
+        self._adopt()
+        self.heartbeat()
+
+        with self.lock:
+            return self._rebalance()
+
+    def _rebalance(self):
+        now = datetime.utcnow()
+        try:
+            live_workers = {
+                worker_id for worker_id, in db.session.query(ShardWorker.worker_id).filter(
+                    ShardWorker.expires > now,
+                    ShardWorker.worker_id != self.worker_id
+                )
+            }
+            fair_share = math.ceil(self.shard_count / (len(live_workers) + 1))
+
+            excess = sorted(self.leases)[fair_share:]
+            if excess:
+                logger.info('Worker {} releasing shards {} to {} other workers'.format(
+                    self.worker_id,
+                    excess,
+                    len(live_workers)
+                ))
+                self._release(excess)
+
+            free_shards = db.session.query(ShardLease.shard_id, ShardLease.fence).filter(
+                or_(ShardLease.owner.is_(None), ShardLease.expires <= now)
+            ).all()
+            for shard_id, fence in free_shards:
+                if len(self.leases) >= fair_share:
+                    break
+
+                # Conditional update, only one worker can win the shard for a given fencing token
+                claimed = db.session.query(ShardLease).filter(
+                    ShardLease.shard_id == shard_id,
+                    ShardLease.fence == fence,
+                    or_(ShardLease.owner.is_(None), ShardLease.expires <= now)
+                ).update({
+                    'owner': self.worker_id,
+                    'expires': now + self.lease_ttl,
+                    'fence': fence + 1
+                }, synchronize_session=False)
+                db.session.commit()
+
+                if claimed:
+                    logger.info('Worker {} claimed shard {}'.format(self.worker_id, shard_id))
+                    self.leases[shard_id] = fence + 1
+        finally:
+            db.session.rollback()
+
+        return self.shards
+
+    def heartbeat(self):
+        """Renew the registration of this worker and extend all leases held by it, dropping any lease which has
+        been lost
+
+        Returns:
+            `set` of `int` - The shards owned by this worker
+        """
+        self._register()
+        with self.lock:
+            for shard_id in list(self.leases):
+                self.verify(shard_id)
+
+        return self.shards
+
+    def verify(self, shard_id):
+        """Extend the lease on a shard, returning `False` if the lease is no longer held by this worker
+
+        Args:
+            shard_id (`int`): Shard to verify
+
+        Returns:
+            `bool`
+        """
+        with self.lock:
+            if shard_id not in self.leases:
+                return False
+
+            now = datetime.utcnow()
+            try:
+                renewed = db.session.query(ShardLease).filter(
+                    ShardLease.shard_id == shard_id,
+                    ShardLease.owner == self.worker_id,
+                    ShardLease.fence == self.leases[shard_id],
+                    ShardLease.expires > now
+                ).update({'expires': now + self.lease_ttl}, synchronize_session=False)
+                db.session.commit()
+            finally:
+                db.session.rollback()
+
+            if not renewed:
+                logger.warning('Worker {} lost the lease on shard {}'.format(self.worker_id, shard_id))
+                del self.leases[shard_id]
+                return False
+
+            return True
+
+    def verify_key(self, key):
+        """Extend the lease on the shard a key belongs to, returning `False` if it is not held by this worker
+
+        Args:
+            key (`str`): Key to verify, usually an issue ID
+
+        Returns:
+            `bool`
+        """
+        return self.verify(get_shard(key, self.shard_count))
+
+    def release(self):
+        """Release all leases held by this worker and remove its registration
+
+        Returns:
+            `None`
+        """
+        with self.lock:
+            try:
+                db.session.query(ShardLease).filter(
+                    ShardLease.owner == self.worker_id
+                ).update({'owner': None, 'expires': None}, synchronize_session=False)
+                db.session.query(ShardWorker).filter(
+                    ShardWorker.worker_id == self.worker_id
+                ).delete(synchronize_session=False)
+                db.session.commit()
+            finally:
+                db.session.rollback()
+                self.leases = {}
+
+    def _release(self, shard_ids):
+        """Release the leases on a set of shards, so other workers can claim them
+
+        Args:
+            shard_ids (`list` of `int`): Shards to release
+
+        Returns:
+            `None`
+        """
+        try:
+            for shard_id in shard_ids:
+                db.session.query(ShardLease).filter(
+                    ShardLease.shard_id == shard_id,
+                    ShardLease.owner == self.worker_id,
+                    ShardLease.fence == self.leases[shard_id]
+                ).update({'owner': None, 'expires': None}, synchronize_session=False)
+            db.session.commit()
+        finally:
+            db.session.rollback()
+            for shard_id in shard_ids:
+                self.leases.pop(shard_id, None)
+
+    def _register(self):
+        """Create or renew the registration of this worker
+
+        Returns:
+            `None`
+        """
+        now = datetime.utcnow()
+        try:
+            renewed = db.session.query(ShardWorker).filter(
+                ShardWorker.worker_id == self.worker_id
+            ).update({'expires': now + self.lease_ttl}, synchronize_session=False)
+            if not renewed:
+                db.session.add(ShardWorker(worker_id=self.worker_id, expires=now + self.lease_ttl))
+
+            # Drop the registrations of workers which stopped without releasing their leases
+            db.session.query(ShardWorker).filter(
+                ShardWorker.expires <= now
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        finally:
+            db.session.rollback()
+
+    def _heartbeat_loop(self):
+        interval = self.lease_ttl.total_seconds() / 3
+        while not self.stopped.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception:
+                logger.exception('Failed renewing the shard leases of worker {}'.format(self.worker_id))
+            finally:
+                db.session.remove()
+
+    def _adopt(self):
+        """Take over the unexpired leases the database records for this worker ID, but which this coordinator does not
+        know about
+
+        Returns:
+            `None`
+        """
+        with self.lock:
+            try:
+                for shard_id, fence in db.session.query(ShardLease.shard_id, ShardLease.fence).filter(
+                    ShardLease.owner == self.worker_id,
+                    ShardLease.expires > datetime.utcnow()
+                ):
+                    if self.leases.get(shard_id) != fence:
+                        logger.info('Worker {} adopted its lease on shard {}'.format(self.worker_id, shard_id))
+                        self.leases[shard_id] = fence
+            finally:
+                db.session.rollback()
+
+    def _create_leases(self):
+        """Create the lease records for any shards which do not yet exist
+
+        Returns:
+            `None`
+        """
+        try:
+            existing = {shard_id for shard_id, in db.session.query(ShardLease.shard_id)}
+            for shard_id in set(range(self.shard_count)) - existing:
+                try:
+                    db.session.add(ShardLease(shard_id=shard_id, owner=None, expires=None, fence=0))
+                    db.session.commit()
+                except IntegrityError:
+                    # Another worker created the record first
+                    db.session.rollback()
+        finally:
+            db.session.rollback()
+
+
+_coordinator = None
+
+
+def get_coordinator(shard_count, lease_ttl):
+    """Returns the shard coordinator of the current process, creating it if needed
+
+    The auditor is instantiated for every run, sharing the coordinator keeps a single set of leases and at most one
+    heartbeat thread per process
+
+    Args:
+        shard_count (`int`): Total number of shards
+        lease_ttl (`int`): Lifetime of a lease, in seconds
+
+    Returns:
+        :obj:`ShardCoordinator`
+    """
+    global _coordinator
+
+    if _coordinator and _coordinator.pid != os.getpid():
+        # Inherited from the parent process, which still owns the leases
+        _coordinator = None
+
+    if _coordinator and (
+        _coordinator.shard_count != shard_count or _coordinator.lease_ttl != timedelta(seconds=lease_ttl)
+    ):
+        _coordinator.shutdown()
+        _coordinator = None
+
+    if not _coordinator:
+        _coordinator = ShardCoordinator(shard_count, lease_ttl)
+
+    return _coordinator
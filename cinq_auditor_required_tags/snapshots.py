@@ -0,0 +1,259 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from cinq_auditor_required_tags.schema import IssueSnapshot, IssueTombstone
+from cloud_inquisitor.database import db
+from cloud_inquisitor.plugins.types.issues import RequiredTagsIssue
+from cloud_inquisitor.schema import Issue, IssueProperty, IssueType
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_PROPERTIES = ('resource_id', 'account_id', 'location', 'resource_type')
+
+SNAPSHOT_PROPERTIES = (
+    'resource_id', 'account_id', 'location', 'resource_type', 'state', 'created', 'last_alert', 'last_change',
+    'missing_tags', 'notes'
+)
+
+# Properties compared to detect snapshots which have drifted from their issue
+SYNC_PROPERTIES = ('created', 'last_alert', 'last_change')
+
+DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+
+def parse_datetime(value):
+    """Parse a datetime property value, which is stored as a string once the issue has been saved
+
+    Args:
+        value (`datetime`, `str`, `float` or `None`): Value to parse
+
+    Returns:
+        :obj:`datetime` or `None`
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+
+    value = value.strip().rstrip('Z')
+    if value.endswith('+00:00'):
+        value = value[:-6]
+
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+
+    return None
+
+
+def local_to_utc(value):
+    """Convert a naive datetime in local time to a naive datetime in UTC
+
+    Args:
+        value (:obj:`datetime`): Datetime to convert, datetimes with a timezone are converted from that timezone
+
+    Returns:
+        :obj:`datetime`
+    """
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def get_snapshot_values(properties):
+    """Convert a dictionary of issue properties into the column values of the snapshot
+
+    The `last_change` property is maintained by `RequiredTagsIssue.update` in local time and stored in UTC, issues which
+    have never been updated use their creation time instead. It is stored with a precision of one second, as not all
+    databases keep microseconds
+
+    Args:
+        properties (`dict`): Issue property names and values
+
+    Returns:
+        `dict`
+    """
+    values = {name: properties.get(name) for name in SNAPSHOT_PROPERTIES}
+    for name in ('state', 'last_alert'):
+        if values[name] is not None:
+            values[name] = str(values[name])
+
+    last_change = parse_datetime(values['last_change'])
+    last_change = local_to_utc(last_change) if last_change else parse_datetime(values['created']) or datetime.utcnow()
+    values['last_change'] = last_change.replace(microsecond=0)
+
+    return values
+
+
+def get_sync_key(values):
+    """Returns the values compared to detect a drifted snapshot
+
+    Args:
+        values (`dict`): Snapshot column values
+
+    Returns:
+        `tuple`
+    """
+    return values['last_change'], values['last_alert']
+
+
+def save_snapshot(issue):
+    """Create or update the snapshot of an issue. The caller is responsible for committing the session
+
+    Args:
+        issue (:obj:`RequiredTagsIssue`): Issue to snapshot
+
+    Returns:
+        :obj:`IssueSnapshot`
+    """
+    values = get_snapshot_values({prop.name: prop.value for prop in issue.issue.properties})
+    snapshot = db.session.query(IssueSnapshot).get(issue.id)
+    if not snapshot:
+        snapshot = IssueSnapshot(issue_id=issue.id)
+        # The issue has come back after being fixed
+        db.session.query(IssueTombstone).filter(
+            IssueTombstone.issue_id == issue.id
+        ).delete(synchronize_session=False)
+
+    if any(getattr(snapshot, name) != value for name, value in values.items()):
+        for name, value in values.items():
+            setattr(snapshot, name, value)
+        db.session.add(snapshot)
+
+    return snapshot
+
+
+def delete_snapshot(issue_id):
+    """Delete the snapshot of an issue, leaving a tombstone. The caller is responsible for committing the session
+
+    Args:
+        issue_id (`str`): ID of the issue
+
+    Returns:
+        `None`
+    """
+    snapshot = db.session.query(IssueSnapshot).get(issue_id)
+    if snapshot:
+        db.session.merge(IssueTombstone(
+            issue_id=issue_id,
+            fixed=datetime.utcnow(),
+            **{name: getattr(snapshot, name) for name in TOMBSTONE_PROPERTIES}
+        ))
+        db.session.delete(snapshot)
+
+
+def prune_tombstones(max_age):
+    """Delete the tombstones of issues fixed more than `max_age` seconds ago
+
+    Args:
+        max_age (`int`): Number of seconds to keep tombstones for
+
+    Returns:
+        `int` - Number of tombstones deleted
+    """
+    try:
+        count = db.session.query(IssueTombstone).filter(
+            IssueTombstone.fixed < datetime.utcnow() - timedelta(seconds=max_age)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+    finally:
+        db.session.rollback()
+
+
+def sync_snapshots(batch_size=500, in_shard=None):
+    """Repair the snapshots which are out of sync with their issues
+
+    Compares the `last_change` and `last_alert` of every issue with its snapshot, and only reloads the issues which
+    differ, have no snapshot yet or no longer exist. Snapshots of issues which no longer exist are replaced by
+    tombstones. With sharding, every worker only repairs the issues in its own shards, so workers never repair the same
+    snapshot. A repair conflicting with a snapshot written at the same time by the event listener is skipped, and
+    retried on the next call
+
+    Args:
+        batch_size (`int`): Number of issues to reload per query
+        in_shard (`callable`): Returns `True` for the IDs of the issues to repair, defaults to all issues
+
+    Returns:
+        `int` - Number of snapshots repaired
+    """
+    try:
+        issue_type_id = IssueType.get(RequiredTagsIssue.issue_type).issue_type_id
+        issues = {
+            issue_id: {} for issue_id, in db.session.query(Issue.issue_id).filter(Issue.issue_type_id == issue_type_id)
+        }
+        properties = db.session.query(
+            IssueProperty.issue_id, IssueProperty.name, IssueProperty.value
+        ).join(
+            Issue, Issue.issue_id == IssueProperty.issue_id
+        ).filter(
+            Issue.issue_type_id == issue_type_id,
+            IssueProperty.name.in_(SYNC_PROPERTIES)
+        )
+        for issue_id, name, value in properties:
+            issues[issue_id][name] = value
+
+        snapshots = {
+            row[0]: row[1:] for row in db.session.query(
+                IssueSnapshot.issue_id, IssueSnapshot.last_change, IssueSnapshot.last_alert
+            )
+        }
+        if in_shard:
+            issues = {issue_id: values for issue_id, values in issues.items() if in_shard(issue_id)}
+            snapshots = {issue_id: values for issue_id, values in snapshots.items() if in_shard(issue_id)}
+        drifted = [
+            issue_id for issue_id, issue_properties in issues.items()
+            if snapshots.get(issue_id) != get_sync_key(get_snapshot_values(issue_properties))
+        ]
+        removed = list(set(snapshots) - set(issues))
+        if not drifted and not removed:
+            return 0
+
+        logger.info('Repairing issue snapshots ({} out of sync, {} removed)'.format(len(drifted), len(removed)))
+        now = datetime.utcnow()
+        for idx in range(0, len(removed), batch_size):
+            batch = removed[idx:idx + batch_size]
+            db.session.bulk_insert_mappings(IssueTombstone, [
+                dict(zip(TOMBSTONE_PROPERTIES, row[1:]), issue_id=row[0], fixed=now)
+                for row in db.session.query(IssueSnapshot.issue_id, *[
+                    getattr(IssueSnapshot, name) for name in TOMBSTONE_PROPERTIES
+                ]).filter(
+                    IssueSnapshot.issue_id.in_(batch),
+                    ~IssueSnapshot.issue_id.in_(
+                        db.session.query(IssueTombstone.issue_id).filter(IssueTombstone.issue_id.in_(batch))
+                    )
+                )
+            ])
+            db.session.query(IssueSnapshot).filter(
+                IssueSnapshot.issue_id.in_(batch)
+            ).delete(synchronize_session=False)
+
+        for idx in range(0, len(drifted), batch_size):
+            batch = drifted[idx:idx + batch_size]
+            batch_properties = {issue_id: {} for issue_id in batch}
+            for issue_id, name, value in db.session.query(
+                IssueProperty.issue_id, IssueProperty.name, IssueProperty.value
+            ).filter(
+                IssueProperty.issue_id.in_(batch),
+                IssueProperty.name.in_(SNAPSHOT_PROPERTIES)
+            ):
+                batch_properties[issue_id][name] = value
+
+            for issue_id, issue_properties in batch_properties.items():
+                db.session.merge(IssueSnapshot(issue_id=issue_id, **get_snapshot_values(issue_properties)))
+
+            # Issues which are back no longer need a tombstone
+            db.session.query(IssueTombstone).filter(
+                IssueTombstone.issue_id.in_(batch)
+            ).delete(synchronize_session=False)
+
+        db.session.commit()
+        return len(drifted) + len(removed)
+    except IntegrityError:
+        logger.warning('Issue snapshots changed while being repaired, retrying on the next run')
+        return 0
+    finally:
+        db.session.rollback()
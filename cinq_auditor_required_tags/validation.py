@@ -0,0 +1,72 @@
+import re
+from functools import lru_cache
+
+from cloud_inquisitor.constants import RGX_EMAIL_VALIDATION_PATTERN
+
+
+class OwnerValidator(object):
+    """Validates owner tag values, caching the results
+
+    Owner values repeat heavily between resources, so results are kept in an LRU cache keyed by the value and the
+    partial match mode. Optionally, the domain of the email address must be in, or be a subdomain of, an entry in the
+    domain allowlist
+    """
+
+    def __init__(self, cache_size=10000, domain_allowlist=None):
+        self.rgx_email = re.compile(RGX_EMAIL_VALIDATION_PATTERN, re.I)
+        self.domain_allowlist = frozenset(domain.lower().strip('.') for domain in domain_allowlist or [])
+        self.validate = lru_cache(maxsize=cache_size)(self._validate)
+
+    def _validate(self, value, partial_match=False):
+        """Returns `True` if the value is a valid owner email address
+
+        Args:
+            value (`str`): Value of the owner tag
+            partial_match (`bool`): Allow the email address to be part of a larger value
+
+        Returns:
+            `bool`
+        """
+        match = self.rgx_email.search(value) if partial_match else self.rgx_email.match(value)
+        if not match:
+            return False
+
+        if self.domain_allowlist:
+            return self.is_allowed_domain(match.group(0).rpartition('@')[2])
+
+        return True
+
+    def is_allowed_domain(self, domain):
+        """Returns `True` if the domain, or any of its parent domains, is in the allowlist
+
+        Args:
+            domain (`str`): Domain to check
+
+        Returns:
+            `bool`
+        """
+        labels = domain.lower().strip('.').split('.')
+        return any('.'.join(labels[idx:]) in self.domain_allowlist for idx in range(len(labels)))
+
+    @property
+    def stats(self):
+        """Returns the cache statistics
+
+        Returns:
+            `dict`
+        """
+        info = self.validate.cache_info()
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'max_size': info.maxsize
+        }
+
+    def clear(self):
+        """Clear the validation cache
+
+        Returns:
+            `None`
+        """
+        self.validate.cache_clear()
@@ -1,19 +1,161 @@
 import json
 from base64 import b64encode
 from collections import OrderedDict
+from datetime import datetime, timedelta
 
+from cinq_auditor_required_tags.checkpoints import PHASE_FINISHED, get_latest_generation
+from cinq_auditor_required_tags.schema import AuditRun, IssueSnapshot, IssueTombstone
+from cloud_inquisitor import CINQ_PLUGINS
 from cloud_inquisitor.config import dbconfig
 from cloud_inquisitor.constants import ROLE_USER, HTTP, NS_AUDITOR_REQUIRED_TAGS
+from cloud_inquisitor.database import db
 from cloud_inquisitor.json_utils import InquisitorJSONEncoder
 from cloud_inquisitor.plugins import BaseView
 from cloud_inquisitor.plugins.types.issues import RequiredTagsIssue
-from cloud_inquisitor.schema import Account
+from cloud_inquisitor.schema import Account, IssueType, Resource
 from cloud_inquisitor.utils import MenuItem
 from cloud_inquisitor.wrappers import check_auth, rollback
 from flask import Response
 from pyexcel import save_book_as
 
 
+EXPORT_TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+
+def search_snapshots(properties, limit=None, page=None, since=None):
+    """Search the issue snapshots, filtering on the indexed columns
+
+    Args:
+        properties (`dict`): Mapping of column names to a list of accepted values
+        limit (`int`): Maximum number of issues to return
+        page (`int`): Page of results to return, starting at 1
+        since (:obj:`datetime`): Only return issues created or changed at or after this time
+
+    Returns:
+        `(int, list)` - Total number of matching issues and the issues on the requested page
+    """
+    query = db.session.query(IssueSnapshot)
+    for name, values in properties.items():
+        query = query.filter(getattr(IssueSnapshot, name).in_(values))
+
+    if since:
+        query = query.filter(IssueSnapshot.last_change >= since)
+
+    total = query.count()
+    query = query.order_by(IssueSnapshot.created.desc(), IssueSnapshot.issue_id)
+    if limit:
+        query = query.limit(limit).offset(((page or 1) - 1) * limit)
+
+    return total, query.all()
+
+
+def search_tombstones(properties, since):
+    """Search the tombstones of fixed issues, filtering on the indexed columns
+
+    Args:
+        properties (`dict`): Mapping of column names to a list of accepted values
+        since (:obj:`datetime`): Only return issues fixed at or after this time
+
+    Returns:
+        `list` of :obj:`IssueTombstone`
+    """
+    query = db.session.query(IssueTombstone).filter(IssueTombstone.fixed >= since)
+    for name, values in properties.items():
+        query = query.filter(getattr(IssueTombstone, name).in_(values))
+
+    return query.order_by(IssueTombstone.fixed, IssueTombstone.issue_id).all()
+
+
+def parse_timestamp(value):
+    """Parse a UTC timestamp, either in seconds since the epoch or in ISO 8601 format
+
+    Args:
+        value (`str`): Timestamp to parse
+
+    Returns:
+        :obj:`datetime`
+
+    Raises:
+        `ValueError` if the value is not a valid timestamp
+    """
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (OverflowError, OSError):
+        # Numbers outside of the range of `datetime`, including `inf` and `nan`
+        raise ValueError('Invalid timestamp: {}'.format(value))
+    except ValueError:
+        pass
+
+    for fmt in EXPORT_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value.rstrip('Z'), fmt)
+        except ValueError:
+            continue
+
+    raise ValueError('Invalid timestamp: {}'.format(value))
+
+
+def get_generation_time(generation):
+    """Returns the time an audit run finished, or `None` if the run does not exist or has not finished
+
+    Args:
+        generation (`int`): Generation of the audit run
+
+    Returns:
+        :obj:`datetime` or `None`
+    """
+    run = db.session.query(AuditRun).get(generation)
+    return run.updated if run and run.phase == PHASE_FINISHED else None
+
+
+def get_resources(resource_ids, batch_size=500):
+    """Load the resources with the given IDs, in batches
+
+    Args:
+        resource_ids (`list` of `str`): IDs of the resources to load
+        batch_size (`int`): Number of resources to load per query
+
+    Returns:
+        `dict` mapping resource IDs to :obj:`Resource` objects
+    """
+    resources = {}
+    resource_ids = list(resource_ids)
+    for idx in range(0, len(resource_ids), batch_size):
+        for resource in db.session.query(Resource).filter(
+            Resource.resource_id.in_(resource_ids[idx:idx + batch_size])
+        ):
+            resources[resource.resource_id] = resource
+
+    return resources
+
+
+def get_resource_json(resources):
+    """Returns the JSON representation of a set of resources, using the resource type plugins
+
+    Args:
+        resources (`dict`): Mapping of resource IDs to :obj:`Resource` objects, as returned by `get_resources`
+
+    Returns:
+        `dict` mapping resource IDs to the JSON representation of the resource
+    """
+    resource_types = {
+        resource_type.resource_type_id: resource_type.resource_type
+        for resource_type in db.ResourceType.find()
+    }
+    resource_classes = {resource.resource_type: resource for resource in map(
+        lambda plugin: plugin.load(),
+        CINQ_PLUGINS['cloud_inquisitor.plugins.types']['plugins']
+    )}
+
+    output = {}
+    for resource_id, resource in resources.items():
+        resource_class = resource_classes.get(resource_types.get(resource.resource_type_id))
+        if resource_class:
+            output[resource_id] = resource_class(resource).to_json()
+
+    return output
+
+
 class RequiredInstanceTags(BaseView):
     URLS = ['/api/v1/requiredTags']
     MENU_ITEMS = [
@@ -51,14 +193,17 @@ class RequiredInstanceTags(BaseView):
         if args['regions']:
             properties['location'] = args['regions']
 
-        total_issues, issues = RequiredTagsIssue.search(
+        total_issues, issues = search_snapshots(
+            properties,
             limit=args['count'],
-            page=args['page'],
-            properties=properties
+            page=args['page']
         )
 
+        issue_type_id = IssueType.get(RequiredTagsIssue.issue_type).issue_type_id
+        resources = get_resource_json(get_resources(issue.resource_id for issue in issues))
+
         return self.make_response({
-            'issues': issues,
+            'issues': [issue.to_json(issue_type_id, resources.get(issue.resource_id)) for issue in issues],
             'requiredTags': required_tags,
             'issueCount': total_issues
         })
@@ -74,8 +219,50 @@ class RequiredInstanceTagsExport(BaseView):
         self.reqparse.add_argument('accounts', type=str, default=None, action='append')
         self.reqparse.add_argument('regions', type=str, default=None, action='append')
         self.reqparse.add_argument('fileFormat', type=str, default='json', choices=['json', 'xlsx'])
+        self.reqparse.add_argument('since', type=str, default=None)
+        self.reqparse.add_argument('sinceGeneration', type=int, default=None)
         args = self.reqparse.parse_args()
 
+        # Taken before querying, so changes made during the export are included in the next delta export
+        export_time = datetime.utcnow()
+        export_generation = get_latest_generation()
+
+        since = None
+        if args['since'] and args['sinceGeneration'] is not None:
+            return self.make_response('Only one of since and sinceGeneration can be provided', HTTP.BAD_REQUEST)
+
+        elif args['since']:
+            try:
+                since = parse_timestamp(args['since'])
+            except ValueError as error:
+                return self.make_response(str(error), HTTP.BAD_REQUEST)
+
+        elif args['sinceGeneration'] is not None:
+            since = get_generation_time(args['sinceGeneration'])
+            if not since:
+                return self.make_response(
+                    'No finished audit run with generation {}'.format(args['sinceGeneration']),
+                    HTTP.BAD_REQUEST
+                )
+
+        # Tombstones of fixed issues are pruned after `tombstone_max_age` days, an older delta would miss them
+        tombstone_max_age = dbconfig.get('tombstone_max_age', NS_AUDITOR_REQUIRED_TAGS, 30)
+        if since and since < datetime.utcnow() - timedelta(days=tombstone_max_age):
+            return self.make_response(
+                'Delta exports are only available for the last {} days, a full export is required'.format(
+                    tombstone_max_age
+                ),
+                HTTP.BAD_REQUEST
+            )
+
+        if since:
+            # Snapshots only keep whole seconds, and changes are timestamped before the batch they are part of is
+            # committed. Changes committed after the previous export are included by going back `export_overlap`
+            # seconds, at the cost of exporting some changes twice
+            since = since.replace(microsecond=0) - timedelta(
+                seconds=dbconfig.get('export_overlap', NS_AUDITOR_REQUIRED_TAGS, 900)
+            )
+
         properties = {}
         if args['accounts']:
             properties['account_id'] = [Account.get(x).account_id for x in args['accounts']]
@@ -83,9 +270,10 @@ class RequiredInstanceTagsExport(BaseView):
         if args['regions']:
             properties['location'] = args['regions']
 
-        total_issues, issues = RequiredTagsIssue.search(
-            properties=properties
-        )
+        total_issues, issues = search_snapshots(properties, since=since)
+        tombstones = search_tombstones(properties, since) if since else []
+        account_names = {account.account_id: account.account_name for account in db.session.query(Account)}
+        resources = get_resources(issue.resource_id for issue in issues)
 
         if args['fileFormat'] == 'xlsx':
             data = OrderedDict()
@@ -93,19 +281,35 @@ class RequiredInstanceTagsExport(BaseView):
                 'resourceId', 'accountName', 'regionName', 'created',
                 'lastChange', 'missingTags', 'notes', 'tags'
             ]
+            if since:
+                headers.append('fixed')
+
             for issue in issues:
-                resource = issue.resource
-                sheet = '{} - {}'.format(resource.account.account_name, issue.location)
+                resource = resources.get(issue.resource_id)
+                account_name = account_names.get(issue.account_id)
+                sheet = '{} - {}'.format(account_name, issue.location)
                 row = [
-                    resource.resource_id,
-                    resource.account.account_name,
+                    issue.resource_id,
+                    account_name,
                     issue.location,
                     issue.created,
                     issue.last_change,
-                    ';'.join(issue.missing_tags),
-                    ';'.join(issue.notes),
-                    ';'.join(['{}={}'.format(tag.key, tag.value) for tag in list(resource.tags)])
+                    ';'.join(issue.missing_tags or []),
+                    ';'.join(issue.notes or []),
+                    ';'.join(['{}={}'.format(tag.key, tag.value) for tag in list(resource.tags)]) if resource else ''
                 ]
+                if since:
+                    row.append(False)
+
+                if sheet in data:
+                    data[sheet].append(row)
+                else:
+                    data.update({sheet: [headers, row]})
+
+            for tombstone in tombstones:
+                account_name = account_names.get(tombstone.account_id)
+                sheet = '{} - {}'.format(account_name, tombstone.location)
+                row = [tombstone.resource_id, account_name, tombstone.location, '', tombstone.fixed, '', '', '', True]
 
                 if sheet in data:
                     data[sheet].append(row)
@@ -119,15 +323,30 @@ class RequiredInstanceTagsExport(BaseView):
             )
         else:
             output = [{
-                'resourceId': issue.resource.resource_id,
+                'resourceId': issue.resource_id,
                 'missingTags': issue.missing_tags,
                 'notes': issue.notes,
                 'regionName': issue.location,
-                'accountName': issue.resource.account.account_name,
-                'tags': {tag.key: tag.value for tag in issue.resource.tags},
+                'accountName': account_names.get(issue.account_id),
+                'tags': {tag.key: tag.value for tag in resources[issue.resource_id].tags}
+                if issue.resource_id in resources else {},
                 'created': issue.created,
                 'lastChange': issue.last_change
             } for issue in issues]
+
+            if since:
+                for item in output:
+                    item['fixed'] = False
+
+                # Fixed issues are returned as tombstones, so consumers can remove them
+                output += [{
+                    'resourceId': tombstone.resource_id,
+                    'regionName': tombstone.location,
+                    'accountName': account_names.get(tombstone.account_id),
+                    'lastChange': tombstone.fixed,
+                    'fixed': True
+                } for tombstone in tombstones]
+
             response = Response(
                 response=b64encode(
                     bytes(
@@ -138,5 +357,8 @@ class RequiredInstanceTagsExport(BaseView):
             )
             response.content_type = 'application/octet-stream'
         response.status_code = HTTP.OK
+        response.headers['X-Export-Timestamp'] = export_time.strftime(EXPORT_TIMESTAMP_FORMATS[0])
+        if export_generation is not None:
+            response.headers['X-Export-Generation'] = str(export_generation)
 
         return response
@@ -19,6 +19,10 @@ setuptools.setup(
         'cloud_inquisitor.plugins.views': [
             'view_required_tags = cinq_auditor_required_tags.views:RequiredInstanceTags',
             'view_required_tags_export = cinq_auditor_required_tags.views:RequiredInstanceTagsExport',
+        ],
+        'cloud_inquisitor.plugins.commands': [
+            'required_tags_listener = cinq_auditor_required_tags.commands:RequiredTagsListener',
+            'required_tags_forecast = cinq_auditor_required_tags.commands:RequiredTagsForecast',
         ]
     },
 
@@ -27,6 +31,7 @@ setuptools.setup(
     install_requires=[
         'cloud_inquisitor~=2.0',
         'Flask~=0.12.2',
+        'numpy>=1.13',
         'pytimeparse==1.1.7',
         'pyexcel==0.4.5',
         'pyexcel-io==0.3.4.1',
@@ -34,7 +39,7 @@ setuptools.setup(
     ],
     extras_require={
         'dev': [],
-        'test': [],
+        'test': ['pytest'],
     },
 
     # Metadata for the project
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from cloud_inquisitor.config import dbconfig
+
+# The plugin reads its configuration when it is imported, use the defaults instead of a configured database
+mock.patch.object(dbconfig, 'get', lambda key, ns=None, default=None: default).start()
+
+
+@pytest.fixture
+def database():
+    """In-memory database holding the tables of the plugin, exposed like `cloud_inquisitor.database.db`"""
+    from cinq_auditor_required_tags.schema import ShardLease, ShardWorker
+
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    for model in (ShardLease, ShardWorker):
+        model.__table__.create(engine)
+
+    session = scoped_session(sessionmaker(bind=engine))
+    yield SimpleNamespace(session=session)
+    session.remove()
+    engine.dispose()
@@ -0,0 +1,270 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.stub import Stubber
+
+from cinq_auditor_required_tags import providers
+from cinq_auditor_required_tags.apicalls import ApiCallCounter
+from cinq_auditor_required_tags.exceptions import ResourceActionError
+
+REGION = 'us-west-2'
+BUCKET = 'cinq-test-bucket'
+
+# Seconds added to every API call by the `latency` fixture parameter
+LATENCY = 0.05
+
+# Number of actions and concurrent workers of the throughput test
+CONCURRENT_ACTIONS = 32
+CONCURRENCY = 8
+
+THROTTLED_BODY = (
+    b'<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.</Message></Error>'
+    b'</Errors><RequestID>throttled</RequestID></Response>'
+)
+STOP_INSTANCES_BODY = (
+    b'<StopInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><requestId>stopped</requestId>'
+    b'<instancesSet/></StopInstancesResponse>'
+)
+
+# Maximum number of API calls per action, or per batch of `DESCRIBE_FILTER_LIMIT` resources for describe actions
+API_CALL_BUDGETS = {
+    'aws_ec2_instance.describe': 1,
+    'aws_ec2_instance.stop': 1,
+    'aws_ec2_instance.kill': 1,
+    'aws_s3_bucket.kill[empty]': 3,
+    'aws_s3_bucket.kill[not_empty]': 6,
+    'aws_s3_bucket.kill[waiting]': 4,
+}
+
+
+def get_resource(resource_id):
+    return SimpleNamespace(
+        resource_id=resource_id,
+        account_id=1,
+        account=SimpleNamespace(account_name='test'),
+        location=REGION,
+        properties=[]
+    )
+
+
+class RawResponse(BytesIO):
+    """Raw HTTP response body, as read by botocore"""
+
+    def stream(self, **kwargs):
+        contents = self.read()
+        while contents:
+            yield contents
+            contents = self.read()
+
+
+def add_latency(client, latency):
+    """Delay every API call made by a client by `latency` seconds"""
+    client.meta.events.register_first(
+        'before-call.*.*',
+        lambda **kwargs: time.sleep(latency),
+        unique_id='cinq-test-latency'
+    )
+
+
+def add_throttling(client, operation, throttles, body):
+    """Answer the first `throttles` HTTP requests for an EC2 operation with a throttling error, and the next ones with
+    `body`. The requests are sent by botocore, so throttled requests are retried like they are against AWS
+
+    Returns:
+        `list` of the requests sent
+    """
+    requests = []
+
+    def on_send(request, **kwargs):
+        requests.append(request)
+        if len(requests) <= throttles:
+            return AWSResponse(request.url, 503, {}, RawResponse(THROTTLED_BODY))
+
+        return AWSResponse(request.url, 200, {}, RawResponse(body))
+
+    client.meta.events.register('before-send.ec2.{}'.format(operation), on_send)
+    return requests
+
+
+@pytest.fixture(params=[0, LATENCY], ids=['no_latency', 'latency'])
+def aws(monkeypatch, request):
+    """Real boto3 clients for a session with API call counting enabled, with the responses stubbed. Every test runs
+    with and without latency added to the API calls"""
+    counter = ApiCallCounter()
+    session = boto3.session.Session(
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        region_name=REGION
+    )
+    # Registered before creating the clients, as the clients copy the event handlers of the session
+    counter.register(session)
+
+    # Throttled calls are retried with a backoff of up to a second per attempt
+    ec2 = session.client('ec2', region_name=REGION, config=Config(retries={'max_attempts': 3}))
+    s3 = session.resource('s3', region_name=REGION)
+    clients = {'ec2': ec2, 's3': s3.meta.client}
+    if request.param:
+        for client in clients.values():
+            add_latency(client, request.param)
+
+    monkeypatch.setattr(session, 'client', lambda service_name, **kwargs: clients[service_name])
+    monkeypatch.setattr(session, 'resource', lambda service_name, *args, **kwargs: s3)
+    monkeypatch.setattr(providers, 'api_calls', counter)
+    monkeypatch.setattr(providers, 'get_aws_session', lambda account: session)
+    monkeypatch.setattr(providers, 'AWSAccount', lambda account: account)
+    monkeypatch.setattr(providers, 'enforcement_journal', mock.Mock())
+
+    stubbers = {name: Stubber(client) for name, client in clients.items()}
+    for stubber in stubbers.values():
+        stubber.activate()
+
+    yield SimpleNamespace(
+        counter=counter,
+        latency=request.param,
+        clients=clients,
+        ec2=stubbers['ec2'],
+        s3=stubbers['s3']
+    )
+
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+        stubber.deactivate()
+
+
+def assert_within_budget(counter, action, budget, batches=1):
+    report = counter.report()[action]
+    assert report['invocations'] == 1
+    assert report['calls'] == sum(report['operations'].values())
+    assert 0 < report['calls'] <= budget * batches
+
+
+def test_describe_ec2_instances(aws):
+    resources = [get_resource('i-{:017x}'.format(idx)) for idx in range(providers.DESCRIBE_FILTER_LIMIT + 1)]
+    instance_ids = [resource.resource_id for resource in resources]
+    batches = [
+        instance_ids[idx:idx + providers.DESCRIBE_FILTER_LIMIT]
+        for idx in range(0, len(instance_ids), providers.DESCRIBE_FILTER_LIMIT)
+    ]
+    for batch in batches:
+        aws.ec2.add_response(
+            'describe_instances',
+            {'Reservations': [{'Instances': [{'InstanceId': batch[0], 'State': {'Name': 'running'}}]}]},
+            {'Filters': [{'Name': 'instance-id', 'Values': batch}]}
+        )
+
+    states = providers.get_live_states(resources, 'aws_ec2_instance')
+
+    assert states[instance_ids[0]] == 'running'
+    assert states[instance_ids[1]] == providers.STATE_NOT_FOUND
+    assert len(states) == len(resources)
+    assert_within_budget(
+        aws.counter, 'aws_ec2_instance.describe', API_CALL_BUDGETS['aws_ec2_instance.describe'], len(batches)
+    )
+
+
+@pytest.mark.parametrize('kwargs', [{'state': 'running'}, {}], ids=['live_state', 'cached_state'])
+def test_stop_ec2_instance(aws, monkeypatch, kwargs):
+    resource = get_resource('i-0123456789abcdef0')
+    monkeypatch.setattr(providers.EC2Instance, 'get', lambda resource_id: SimpleNamespace(state='running'))
+    aws.ec2.add_response('stop_instances', {}, {'InstanceIds': [resource.resource_id]})
+
+    assert providers.process_action(resource, 'stop', 'aws_ec2_instance', **kwargs)
+    assert_within_budget(aws.counter, 'aws_ec2_instance.stop', API_CALL_BUDGETS['aws_ec2_instance.stop'])
+
+
+@pytest.mark.parametrize('throttles', [1, 2])
+def test_stop_throttled_ec2_instance(aws, throttles):
+    resource = get_resource('i-0123456789abcdef0')
+    # The stubbed responses are returned before the request is sent, and are never retried
+    aws.ec2.deactivate()
+    requests = add_throttling(aws.clients['ec2'], 'StopInstances', throttles, STOP_INSTANCES_BODY)
+
+    assert providers.process_action(resource, 'stop', 'aws_ec2_instance', state='running')
+    assert len(requests) == throttles + 1
+    # Retries of throttled requests are made by botocore within a single API call
+    assert_within_budget(aws.counter, 'aws_ec2_instance.stop', API_CALL_BUDGETS['aws_ec2_instance.stop'])
+
+
+def test_stop_stopped_ec2_instance(aws):
+    resource = get_resource('i-0123456789abcdef0')
+
+    assert not providers.process_action(resource, 'stop', 'aws_ec2_instance', state='stopped')
+    assert aws.counter.report()['aws_ec2_instance.stop']['calls'] == 0
+
+
+def test_terminate_ec2_instance(aws):
+    resource = get_resource('i-0123456789abcdef0')
+    aws.ec2.add_response('terminate_instances', {}, {'InstanceIds': [resource.resource_id]})
+
+    assert providers.process_action(resource, 'kill', 'aws_ec2_instance', state='running')
+    assert_within_budget(aws.counter, 'aws_ec2_instance.kill', API_CALL_BUDGETS['aws_ec2_instance.kill'])
+
+
+def test_delete_empty_s3_bucket(aws):
+    aws.s3.add_response('list_objects', {'Contents': []})
+    aws.s3.add_response('list_object_versions', {'Versions': []})
+    aws.s3.add_response('delete_bucket', {}, {'Bucket': BUCKET})
+
+    assert providers.process_action(get_resource(BUCKET), 'kill', 'aws_s3_bucket')
+    assert_within_budget(aws.counter, 'aws_s3_bucket.kill', API_CALL_BUDGETS['aws_s3_bucket.kill[empty]'])
+
+
+def test_delete_s3_bucket_with_objects(aws):
+    aws.s3.add_response('list_objects', {'Contents': [{'Key': 'object'}]})
+    aws.s3.add_response('list_object_versions', {'Versions': []})
+    aws.s3.add_client_error('get_bucket_lifecycle_configuration', 'NoSuchLifecycleConfiguration', http_status_code=404)
+    aws.s3.add_client_error('get_bucket_policy', 'NoSuchBucketPolicy', http_status_code=404)
+    aws.s3.add_response('put_bucket_lifecycle_configuration', {})
+    aws.s3.add_response('put_bucket_policy', {})
+
+    assert not providers.process_action(get_resource(BUCKET), 'kill', 'aws_s3_bucket')
+    assert_within_budget(aws.counter, 'aws_s3_bucket.kill', API_CALL_BUDGETS['aws_s3_bucket.kill[not_empty]'])
+
+
+def test_delete_s3_bucket_waiting_for_lifecycle(aws):
+    aws.s3.add_response('list_objects', {'Contents': [{'Key': 'object'}]})
+    aws.s3.add_response('list_object_versions', {'Versions': []})
+    aws.s3.add_response('get_bucket_lifecycle_configuration', {'Rules': [{
+        'ID': 'cinqRemoveDeletedExpiredMarkers',
+        'Status': 'Enabled',
+        'Filter': {'Prefix': ''},
+        'Expiration': {'ExpiredObjectDeleteMarker': True}
+    }]})
+    aws.s3.add_response('get_bucket_policy', {'Policy': json.dumps({'Statement': [{'Sid': 'cinqDenyObjectUploads'}]})})
+
+    with pytest.raises(ResourceActionError):
+        providers.process_action(get_resource(BUCKET), 'kill', 'aws_s3_bucket')
+
+    assert_within_budget(aws.counter, 'aws_s3_bucket.kill', API_CALL_BUDGETS['aws_s3_bucket.kill[waiting]'])
+
+
+def test_concurrent_throughput(aws, record_property):
+    resources = [get_resource('i-{:017x}'.format(idx)) for idx in range(CONCURRENT_ACTIONS)]
+    for _ in resources:
+        aws.ec2.add_response('terminate_instances', {})
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(
+            lambda resource: providers.process_action(resource, 'kill', 'aws_ec2_instance', state='running'),
+            resources
+        ))
+    elapsed = time.time() - start
+
+    assert all(results)
+    report = aws.counter.report()['aws_ec2_instance.kill']
+    assert report['invocations'] == len(resources)
+    assert report['calls_per_action'] <= API_CALL_BUDGETS['aws_ec2_instance.kill']
+
+    record_property('throughput', len(resources) / elapsed)
+    if aws.latency:
+        # The API calls of the workers overlap instead of adding up
+        assert elapsed < len(resources) * aws.latency
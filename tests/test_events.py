@@ -0,0 +1,55 @@
+from cinq_auditor_required_tags.events import FileEventQueue, LocalEventQueue
+
+
+def test_local_queue_redelivers_unacked_events():
+    event_queue = LocalEventQueue(visibility_timeout=0)
+    event_queue.publish('aws_ec2_instance', 'i-1')
+    event_queue.publish('aws_ec2_instance', 'i-2')
+
+    first, second = event_queue.receive()
+    event_queue.ack(second)
+
+    assert event_queue.receive() == [first]
+    event_queue.ack(first)
+    assert event_queue.receive() == []
+
+
+def test_local_queue_retries_after_delay():
+    event_queue = LocalEventQueue(visibility_timeout=0)
+    event_queue.publish('aws_ec2_instance', 'i-1')
+
+    event, = event_queue.receive()
+    event_queue.retry(event, 3600)
+
+    assert event_queue.receive() == []
+    event_queue.retry(event, 0)
+    assert event_queue.receive() == [event]
+
+
+def test_file_queue_keeps_failed_events_before_acked_ones(tmpdir):
+    path = str(tmpdir.join('events.jsonl'))
+    event_queue = FileEventQueue(path, visibility_timeout=3600)
+    for resource_id in ('i-1', 'i-2', 'i-3'):
+        event_queue.publish('aws_ec2_instance', resource_id)
+
+    first, second, third = event_queue.receive()
+    event_queue.ack(second)
+    event_queue.ack(third)
+
+    # Not acknowledged, so delivered again after a restart even though later events were acknowledged
+    restarted = FileEventQueue(path)
+    assert [event.resource_id for event in restarted.receive()] == ['i-1', 'i-2', 'i-3']
+
+    event_queue.ack(first)
+    assert FileEventQueue(path).receive() == []
+
+
+def test_file_queue_redelivers_unacked_events(tmpdir):
+    event_queue = FileEventQueue(str(tmpdir.join('events.jsonl')), visibility_timeout=0)
+    event_queue.publish('aws_ec2_instance', 'i-1')
+
+    event, = event_queue.receive()
+    assert event_queue.receive() == [event]
+
+    event_queue.ack(event)
+    assert event_queue.receive() == []
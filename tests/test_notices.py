@@ -0,0 +1,101 @@
+import glob
+import os
+from types import SimpleNamespace
+
+import cloud_inquisitor
+import pytest
+from jinja2 import Environment
+
+from cinq_auditor_required_tags import add_notice
+from cinq_auditor_required_tags.actions import AuditAction, Notice
+from cloud_inquisitor.constants import AuditActions
+
+TEMPLATE_NAMES = ('required_tags_notice.html', 'required_tags_notice.txt')
+
+
+def get_stock_template(name):
+    """Returns the source of a notification template shipped with cloud_inquisitor"""
+    package_dir = os.path.dirname(cloud_inquisitor.__file__)
+    paths = sorted(glob.glob(os.path.join(package_dir, '**', '{}*'.format(name)), recursive=True))
+    if not paths:
+        pytest.skip('Template {} is not shipped with this cloud_inquisitor version'.format(name))
+
+    with open(paths[0], 'r') as fh:
+        return fh.read()
+
+
+def get_action(action, issue_id, resource_id):
+    properties = {
+        'resource_id': resource_id,
+        'account_id': 1,
+        'location': 'us-west-2',
+        'resource_type': 'EC2 Instance',
+        'created': 1500000000.0,
+        'last_alert': '-1 seconds',
+        'missing_tags': ['owner'],
+        'notes': []
+    }
+    issue = SimpleNamespace(
+        id=issue_id,
+        issue=SimpleNamespace(properties=[
+            SimpleNamespace(name=name, value=value) for name, value in properties.items()
+        ])
+    )
+    resource = SimpleNamespace(
+        resource_id=resource_id,
+        resource_name='EC2 Instance',
+        location='us-west-2',
+        account=SimpleNamespace(account_name='test'),
+        tags=[SimpleNamespace(key='Name', value='test')],
+        get_name_or_id=lambda: 'test'
+    )
+    return AuditAction(
+        action,
+        issue,
+        resource,
+        action_description='Resource stopped' if action == AuditActions.STOP else None,
+        last_alert='-1 seconds',
+        stop_after='4 weeks',
+        remove_after='12 weeks',
+        missing_tags=['owner'],
+        notes=[]
+    )
+
+
+@pytest.fixture
+def notices():
+    notices = {}
+    add_notice(notices, Notice.from_action(get_action(AuditActions.STOP, 'reqtag-1', 'i-1')), [('email', 'a@b.c')])
+    add_notice(notices, Notice.from_action(get_action(AuditActions.FIXED, 'reqtag-2', 'i-2')), [('email', 'a@b.c')])
+    return notices
+
+
+@pytest.mark.parametrize('name', TEMPLATE_NAMES)
+def test_stock_templates_render_notices(notices, name):
+    template = Environment().from_string(get_stock_template(name))
+
+    for data in notices.values():
+        body = template.render(data=data)
+        assert 'i-1' in body
+        assert 'i-2' in body
+
+
+@pytest.mark.parametrize('name', TEMPLATE_NAMES)
+def test_stock_templates_render_restored_notices(notices, name):
+    template = Environment().from_string(get_stock_template(name))
+    restored = {
+        contact: {key: [Notice.from_json(notice.to_json()) for notice in items] for key, items in data.items()}
+        for contact, data in notices.items()
+    }
+
+    for contact, data in restored.items():
+        assert template.render(data=data) == template.render(data=notices[contact])
+
+
+def test_notice_keeps_issue_fields():
+    notice = Notice.from_action(get_action(AuditActions.ALERT, 'reqtag-1', 'i-1'))
+
+    assert notice['issue'].resource_type == 'EC2 Instance'
+    assert notice['issue'].id == 'reqtag-1'
+    assert notice['resource'].get_name_or_id() == 'test'
+    assert Notice.from_json(notice.to_json()).issue.missing_tags == ['owner']
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cinq_auditor_required_tags import sharding
+from cinq_auditor_required_tags.schema import ShardLease, ShardWorker
+from cinq_auditor_required_tags.sharding import ShardCoordinator, get_shard
+
+SHARD_COUNT = 8
+
+
+@pytest.fixture
+def db(database, monkeypatch):
+    monkeypatch.setattr(sharding, 'db', database)
+    return database
+
+
+def get_coordinator(worker_id):
+    return ShardCoordinator(SHARD_COUNT, 900, worker_id=worker_id)
+
+
+def expire_worker(db, worker_id):
+    past = datetime.utcnow() - timedelta(seconds=1)
+    db.session.query(ShardLease).filter(ShardLease.owner == worker_id).update({'expires': past})
+    db.session.query(ShardWorker).filter(ShardWorker.worker_id == worker_id).update({'expires': past})
+    db.session.commit()
+
+
+def test_get_shard_is_stable():
+    assert get_shard('reqtag-abc', SHARD_COUNT) == get_shard('reqtag-abc', SHARD_COUNT)
+    assert 0 <= get_shard('reqtag-abc', SHARD_COUNT) < SHARD_COUNT
+
+
+def test_single_worker_claims_all_shards(db):
+    worker = get_coordinator('worker-1')
+
+    assert worker.claim() == set(range(SHARD_COUNT))
+
+
+def test_new_worker_gets_fair_share(db):
+    first = get_coordinator('worker-1')
+    second = get_coordinator('worker-2')
+    first.claim()
+
+    # All shards are taken, but registering lets the first worker release the excess on its next claim
+    assert second.claim() == set()
+    assert len(first.claim()) == SHARD_COUNT // 2
+    assert len(second.claim()) == SHARD_COUNT // 2
+    assert first.shards.isdisjoint(second.shards)
+    assert first.shards | second.shards == set(range(SHARD_COUNT))
+
+
+def test_expired_lease_is_taken_over_and_fenced(db):
+    first = get_coordinator('worker-1')
+    second = get_coordinator('worker-2')
+    first.claim()
+    expire_worker(db, 'worker-1')
+
+    assert second.claim() == set(range(SHARD_COUNT))
+    assert not first.verify(0)
+    assert 0 not in first.shards
+
+
+def test_stale_worker_can_not_reclaim_with_old_fence(db):
+    first = get_coordinator('worker-1')
+    first.claim()
+    fence = first.leases[0]
+    expire_worker(db, 'worker-1')
+    get_coordinator('worker-2').claim()
+
+    lease = db.session.query(ShardLease).get(0)
+    assert lease.owner == 'worker-2'
+    assert lease.fence == fence + 1
+
+
+def test_heartbeat_extends_leases(db):
+    worker = get_coordinator('worker-1')
+    worker.claim()
+    soon = datetime.utcnow() + timedelta(seconds=5)
+    db.session.query(ShardLease).update({'expires': soon})
+    db.session.commit()
+
+    assert worker.heartbeat() == set(range(SHARD_COUNT))
+    assert all(lease.expires > soon for lease in db.session.query(ShardLease))
+
+
+def test_release_frees_shards_and_registration(db):
+    first = get_coordinator('worker-1')
+    second = get_coordinator('worker-2')
+    first.claim()
+    second.claim()
+    first.release()
+
+    assert first.shards == set()
+    assert db.session.query(ShardWorker).get('worker-1') is None
+    assert second.claim() == set(range(SHARD_COUNT))
+
+
+def test_new_coordinator_adopts_leases_of_same_worker(db):
+    get_coordinator('worker-1').claim()
+
+    # The auditor is instantiated for every run, a new coordinator with the same worker ID keeps the shards
+    assert get_coordinator('worker-1').claim() == set(range(SHARD_COUNT))
+
+
+def test_stop_keeps_leases(db):
+    worker = get_coordinator('worker-1')
+    worker.claim()
+    worker.start()
+    worker.stop()
+
+    assert worker.heartbeat_thread is None
+    assert {lease.owner for lease in db.session.query(ShardLease)} == {'worker-1'}
+
+
+def test_process_shares_one_coordinator(db, monkeypatch):
+    monkeypatch.setattr(sharding, '_coordinator', None)
+
+    assert sharding.get_coordinator(SHARD_COUNT, 900) is sharding.get_coordinator(SHARD_COUNT, 900)